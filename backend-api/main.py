@@ -1,4 +1,5 @@
 """FastAPI バックエンド - 納品書処理システム"""
+import logging
 import os
 import sys
 from pathlib import Path
@@ -13,6 +14,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
+from middleware.idempotency import IdempotencyMiddleware
 from routes import pdf, billing, config, purchase, companies
 
 app = FastAPI(
@@ -37,6 +39,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 保存系 POST の再送は Idempotency-Key で初回レスポンスを返す
+app.add_middleware(IdempotencyMiddleware, paths=("/api/save-purchase",))
+
+# 仕入れ保存の受信デバッグログ・再送検出ログは開発時のみ出力（本番は WARNING 以上）
+for _logger_name in ("routes.purchase", "middleware.idempotency"):
+    _logger = logging.getLogger(_logger_name)
+    if os.getenv("ENVIRONMENT") == "production":
+        _logger.setLevel(logging.WARNING)
+    else:
+        _logger.setLevel(logging.DEBUG)
+        _logger.addHandler(logging.StreamHandler())
+
 # ルーター登録（APIは /api プレフィックス）
 app.include_router(pdf.router, prefix="/api", tags=["PDF処理"])
 app.include_router(billing.router, prefix="/api", tags=["請求管理"])
@@ -0,0 +1,157 @@
+"""Idempotency-Key ヘッダによる保存リクエストの重複排除ミドルウェア
+
+同じ Idempotency-Key・同じリクエストボディの POST が再送された場合、
+エンドポイントを実行せずに初回のレスポンスをそのまま返す。
+（ネットワーク再送・ボタン連打で DB 検索や正規化処理を繰り返さないため）
+
+キャッシュはプロセス内のみ。ワーカーをまたぐ重複は従来どおり
+DB の save_requests テーブル（request_id）で弾く。
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 既定の保持期間（24時間）
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+def _is_completed(body: bytes) -> bool:
+    """保存が完了したレスポンスか（"success": false の業務エラーは再送で再実行させる）
+
+    save-purchase は伝票番号の重複などを 200 + success=false で返すため、
+    ステータスだけで判定すると既存伝票を削除した後の再送まで古い結果を返してしまう。
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return True
+    return not (isinstance(payload, dict) and payload.get("success") is False)
+
+
+class InMemoryIdempotencyStore:
+    """保存済みレスポンスを有効期限付きで保持する dict ベースのストア"""
+
+    def __init__(self):
+        self._entries: dict[str, tuple[float, dict]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return response
+
+    def put(self, key: str, response: dict, ttl_seconds: int = DEFAULT_TTL_SECONDS) -> None:
+        now = time.monotonic()
+        with self._lock:
+            # 期限切れエントリを掃除してから登録
+            expired = [k for k, (exp, _) in self._entries.items() if exp < now]
+            for k in expired:
+                del self._entries[k]
+            self._entries[key] = (now + ttl_seconds, response)
+
+
+class IdempotencyMiddleware:
+    """指定パスへの POST を Idempotency-Key + ボディの SHA-256 でキャッシュする ASGI ミドルウェア
+
+    - ヘッダが無いリクエストはそのまま通す
+    - 保存が完了した 2xx のレスポンスのみ保存する（エラー・success=false は再送で再実行できるように）
+    """
+
+    def __init__(
+        self,
+        app,
+        paths: tuple[str, ...] = ("/api/save-purchase",),
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        store: Optional[InMemoryIdempotencyStore] = None,
+    ):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.ttl_seconds = ttl_seconds
+        self.store = store or InMemoryIdempotencyStore()
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key = None
+        for name, value in scope["headers"]:
+            if name == b"idempotency-key":
+                idempotency_key = value.decode("latin-1").strip()
+                break
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+
+        # ボディを読み切ってハッシュ（同じキーでも内容が違えば別リクエスト扱い）
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        body_hash = hashlib.sha256(body).hexdigest()
+        cache_key = f"{scope['path']}:{idempotency_key}:{body_hash}"
+
+        cached = self.store.get(cache_key)
+        if cached is not None:
+            logger.info("再送を検出 → 保存済みレスポンスを返却: %s", idempotency_key)
+            await send({
+                "type": "http.response.start",
+                "status": cached["status"],
+                "headers": cached["headers"],
+            })
+            await send({"type": "http.response.body", "body": cached["body"]})
+            return
+
+        # 読み切ったボディをエンドポイントへ渡し直す
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        response: dict = {"status": 0, "headers": [], "body": []}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                if not message.get("more_body", False) and 200 <= response["status"] < 300:
+                    response_body = b"".join(response["body"])
+                    if _is_completed(response_body):
+                        self.store.put(
+                            cache_key,
+                            {
+                                "status": response["status"],
+                                "headers": response["headers"],
+                                "body": response_body,
+                            },
+                            ttl_seconds=self.ttl_seconds,
+                        )
+            await send(message)
+
+        await self.app(scope, replay_receive, capture_send)
@@ -8,7 +8,7 @@ import re
 from src import sheets_client
 from src.sheets_client import PreviousBilling, _find_company_row, match_company_name, parse_amount
 from src.pdf_extractor import DeliveryNote, DeliveryItem
-from src.database import MonthlyItemsDB
+from src.database import get_shared_db
 from src.canonical_companies import list_canonicals
 
 
@@ -97,7 +97,7 @@ async def save_billing(request: SaveBillingRequest):
 
     try:
         # 冪等性チェック
-        db = MonthlyItemsDB()
+        db = get_shared_db()
         if request.request_id and db.check_request_id(request.request_id):
             return {
                 "success": True,
@@ -220,7 +220,7 @@ async def update_payment(request: UpdatePaymentRequest):
     print(f"    [DEPRECATED] POST /update-payment は POST /payments と統合予定")
 
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
 
         # 1. DB 上の現在値を取得（previous_value 用）
         prev_entry = db.get_payment(request.company_name, request.year_month)
@@ -263,7 +263,7 @@ async def get_companies_and_months():
     年月 = 納品書または入金が存在する年月。
     """
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
 
         # 会社: マスタ(挿入順)を基本に、取引実績にしか無い会社を後ろに追加
         master = [c["canonical_name"] for c in db.list_companies("sales")]
@@ -292,7 +292,7 @@ async def get_companies_and_months():
 async def get_billing_table():
     """売上集計表を DB から再構築（会社×月: 発生/消費税/消滅/残高）"""
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
 
         # 対象の会社・年月（取引 or 入金があるもの）
         totals = db.get_all_monthly_totals()
@@ -358,10 +358,10 @@ async def get_delivery_notes(
 ):
     """指定会社・年月の納品書一覧（ID付き）を取得"""
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
         notes = db.get_delivery_notes_with_ids(company_name, year_month)
         return DeliveryNotesResponse(
-            notes=[DeliveryNoteOut(**n) for n in notes]
+            notes=[DeliveryNoteOut(**n._asdict()) for n in notes]
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -371,7 +371,7 @@ async def get_delivery_notes(
 async def update_delivery_note(note_id: int, request: UpdateDeliveryNoteRequest):
     """納品書の金額を更新"""
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
         db.update_delivery_note_amounts(
             note_id, request.subtotal, request.tax, request.total
         )
@@ -418,7 +418,7 @@ async def get_delivery_notes_with_items(
 ):
     """指定会社・年月の納品書一覧（明細付き、ID付き）を取得"""
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
         # canonical 名に正規化
         target_year = _extract_year_from_year_month(year_month)
         canonical = sheets_client.get_canonical_company_name(
@@ -435,15 +435,15 @@ async def get_delivery_notes_with_items(
 
         result = []
         for n in notes_with_id:
-            items = items_by_slip.get(n["slip_number"], [])
+            items = items_by_slip.get(n.slip_number, [])
             result.append(
                 DeliveryNoteWithItems(
-                    id=n["id"],
-                    slip_number=n["slip_number"],
-                    date=n["date"],
-                    subtotal=n["subtotal"],
-                    tax=n["tax"],
-                    total=n["total"],
+                    id=n.id,
+                    slip_number=n.slip_number,
+                    date=n.date,
+                    subtotal=n.subtotal,
+                    tax=n.tax,
+                    total=n.total,
                     items=[
                         DeliveryItemEdit(
                             product_code=item.product_code,
@@ -474,7 +474,7 @@ async def update_delivery_note_with_items(
     正規化される。
     """
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
 
         # 1. note_id から既存 note の情報取得 (company_name, year_month, slip_number)
         with db._get_connection() as conn:
@@ -584,7 +584,7 @@ async def get_payments(
 ):
     """消滅（入金）エントリ一覧を取得"""
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
         items = db.list_payments(
             company_name=company_name or None,
             year_month=year_month or None,
@@ -602,7 +602,7 @@ async def upsert_payment(request: PaymentRequest):
     - シート: sync_sheet=true の場合、売上集計表の消滅セルに書き込み（best-effort）
     """
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
 
         # 会社名を正規化（シート基準に合わせる）
         target_year = _extract_year_from_year_month(request.year_month)
@@ -643,7 +643,7 @@ async def get_billing_ledger(
 ):
     """指定会社・年の12ヶ月分の台帳をDBから計算して返す"""
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
         entries = []
         for month in range(1, 13):
             ym = f"{year}年{month}月"
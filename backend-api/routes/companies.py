@@ -7,7 +7,8 @@ from typing import Optional
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from src.database import MonthlyItemsDB
+from src.canonical_companies import clear_company_master_caches
+from src.database import get_shared_db
 
 router = APIRouter()
 
@@ -63,7 +64,7 @@ async def list_company_master(domain: str, include_inactive: bool = False):
     """得意先/仕入先マスタ一覧を取得"""
     _validate_domain(domain)
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
         companies = db.list_companies(domain, include_inactive=include_inactive)
         return CompanyMasterListResponse(
             companies=[CompanyMasterItem(**c) for c in companies]
@@ -77,7 +78,7 @@ async def create_company_master(request: CreateCompanyRequest):
     """得意先/仕入先を追加"""
     _validate_domain(request.domain)
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
         created = db.add_company(
             domain=request.domain,
             canonical_name=request.canonical_name,
@@ -86,6 +87,7 @@ async def create_company_master(request: CreateCompanyRequest):
             department=request.department,
             taxable=request.taxable,
         )
+        clear_company_master_caches()
         return CompanyMasterItem(**created)
     except ValueError as e:
         # 重複・表記ゆれ・空名は 400（業務エラー）
@@ -98,7 +100,7 @@ async def create_company_master(request: CreateCompanyRequest):
 async def update_company_master(company_id: int, request: UpdateCompanyRequest):
     """得意先/仕入先を編集（住所・事業部・課税区分・有効/無効）"""
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
         updated = db.update_company(
             company_id,
             postal_code=request.postal_code,
@@ -110,6 +112,7 @@ async def update_company_master(company_id: int, request: UpdateCompanyRequest):
         )
         if updated is None:
             raise HTTPException(status_code=404, detail="対象が見つかりません")
+        clear_company_master_caches()
         return CompanyMasterItem(**updated)
     except HTTPException:
         raise
@@ -121,10 +124,11 @@ async def update_company_master(company_id: int, request: UpdateCompanyRequest):
 async def deactivate_company_master(company_id: int):
     """得意先/仕入先を無効化（論理削除・過去伝票は壊さない）"""
     try:
-        db = MonthlyItemsDB()
+        db = get_shared_db()
         updated = db.deactivate_company(company_id)
         if updated is None:
             raise HTTPException(status_code=404, detail="対象が見つかりません")
+        clear_company_master_caches()
         return CompanyMasterItem(**updated)
     except HTTPException:
         raise
@@ -1,27 +1,52 @@
 """PDF処理関連のエンドポイント"""
+import asyncio
+import functools
+import hashlib
+import json
+import os
 import tempfile
 import io
 import base64
+import re
 import shutil
 import time
+import traceback
+import unicodedata
+from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
+import anyio
 from fastapi import APIRouter, File, Form, UploadFile, HTTPException
 from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel
 from pdf2image import convert_from_path
+from pdf2image.pdf2image import pdfinfo_from_path
 from PIL import Image
 
+from src.config import load_company_config
 from src.extractor import UnifiedExtractor
 from src import sheets_client
-from src.sheets_client import PreviousBilling
+from src.sheets_client import CompanyInfo, PreviousBilling
 from src.invoice_generator import InvoiceGenerator
 from src.pdf_extractor import DeliveryNote, DeliveryItem
 from src.canonical_companies import list_canonicals
+from src.database import get_shared_db
 
 router = APIRouter()
 
+_YEAR_MONTH_RE = re.compile(r'(\d+)年(\d+)月')
+
+# アップロードをディスクへ書き出す際のチャンクサイズ
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 処理中の process-pdf（キー: PDF内容+フォーム値のハッシュ）
+_INFLIGHT: dict[str, asyncio.Future] = {}
+_INFLIGHT_LOCK = asyncio.Lock()
+
+# 再生成した請求書PDFのキャッシュ（キー: 入力内容のハッシュ）
+_INVOICE_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
 
 class DeliveryItemResponse(BaseModel):
     slip_number: str
@@ -104,7 +129,6 @@ def _extract_filename_keywords(filename: str) -> list[str]:
 
     例: "0326バロック返品伝票_佐藤.pdf" → ["バロック"]
     """
-    import re
     name = re.sub(r'\.\w+$', '', filename)  # 拡張子除去
     name = re.sub(r'^\d{4,8}', '', name)  # 先頭の日付除去
     # 文書タイプ・一般キーワードを除去
@@ -124,8 +148,6 @@ def _score_company_candidate(
     - ファイル名キーワードの部分一致: +10
     - 抽出会社名トークンの部分一致: +5
     """
-    import re
-    import unicodedata
     score = 0
     # NFKC正規化（濁点の合成形/分解形の差異、半角/全角の差異を吸収）
     candidate_n = unicodedata.normalize('NFKC', candidate)
@@ -154,6 +176,41 @@ def _score_company_candidate(
     return score
 
 
+def _invoice_cache_key(payload: dict) -> str:
+    """請求書PDFの入力内容（正規化JSON）からキャッシュキーを算出"""
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _link_or_copy(src: Path, dst: Path):
+    """src を dst にハードリンク（別ファイルシステム等で失敗したらコピー）"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+
+def _evict_invoice_cache(cache_dir: Path):
+    """キャッシュ合計が上限を超えたら、最終利用が古い順に削除（LRU）"""
+    entries = []
+    total = 0
+    for path in cache_dir.glob("*.pdf"):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+    if total <= _INVOICE_CACHE_MAX_BYTES:
+        return
+    entries.sort()
+    for _, size, path in entries:
+        path.unlink(missing_ok=True)
+        total -= size
+        if total <= _INVOICE_CACHE_MAX_BYTES:
+            break
+
+
 def extract_year_month(date_str: str) -> str:
     """日付文字列からYYYY-MM形式の年月を抽出"""
     if date_str and '/' in date_str:
@@ -161,7 +218,6 @@ def extract_year_month(date_str: str) -> str:
         if len(parts) >= 2:
             return f"{parts[0]}-{parts[1]}"
 
-    from datetime import datetime
     return datetime.now().strftime("%Y-%m")
 
 
@@ -174,22 +230,83 @@ async def process_pdf(
     reset_existing: bool = Form(False),
     company_name_override: str = Form(""),
 ):
-    """納品書PDFを処理して請求書を生成"""
+    """納品書PDFを処理して請求書を生成
+
+    同一内容・同一条件のリクエストが処理中の場合は、その結果を待って共有する
+    （UIリトライや二重アップロードで LLM 抽出・PDF生成が重複実行されるのを防ぐ）。
+    """
 
     # ファイル形式チェック
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="PDFファイルのみアップロード可能です")
 
-    # 一時ファイルに保存
+    # 一時ファイルに保存（書き込みながらハッシュを計算）
+    digest = hashlib.blake2b()
     with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
+        while chunk := await file.read(_UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            tmp_file.write(chunk)
         tmp_path = Path(tmp_file.name)
 
+    # 抽出結果に影響するフォーム値もキーに含める
+    digest.update(repr((
+        file.filename, sales_person, year, month, company_name_override,
+    )).encode("utf-8"))
+    key = digest.hexdigest()
+
+    async with _INFLIGHT_LOCK:
+        inflight = _INFLIGHT.get(key)
+        is_owner = inflight is None
+        if is_owner:
+            inflight = asyncio.get_running_loop().create_future()
+            _INFLIGHT[key] = inflight
+
+    if not is_owner:
+        tmp_path.unlink(missing_ok=True)
+        print(f"  同一PDFを処理中のため結果を共有: {file.filename}")
+        # shield: 待機側のキャンセルで共有 Future 自体がキャンセルされないようにする
+        return await asyncio.shield(inflight)
+
+    try:
+        # LLM 抽出・PDF生成は同期処理なのでワーカースレッドで実行する
+        # （イベントループを塞がず、処理中に届いた同一リクエストが共有 Future を待てる）
+        response = await anyio.to_thread.run_sync(functools.partial(
+            _process_pdf_file,
+            tmp_path,
+            filename=file.filename,
+            sales_person=sales_person,
+            year=year,
+            month=month,
+            company_name_override=company_name_override,
+        ))
+        inflight.set_result(response)
+        return response
+    except Exception as e:
+        inflight.set_exception(e)
+        inflight.exception()  # 待機者がいない場合の未取得警告を抑止
+        raise
+    finally:
+        if not inflight.done():
+            inflight.cancel()
+        _INFLIGHT.pop(key, None)
+        # 一時ファイルを削除
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _process_pdf_file(
+    tmp_path: Path,
+    filename: str,
+    sales_person: str,
+    year: Optional[int],
+    month: Optional[int],
+    company_name_override: str,
+) -> ProcessPDFResponse:
+    """保存済みの納品書PDFから抽出・請求書PDF生成を行い、レスポンスを組み立てる"""
     try:
         # 1. PDF抽出 (バックエンドはEXTRACTOR_BACKEND env で切替可能。既定: claude)
         extractor = UnifiedExtractor()
-        delivery_note = extractor.extract(tmp_path, original_filename=file.filename)
+        delivery_note = extractor.extract(tmp_path, original_filename=filename)
 
         # 会社名がNoneの場合はエラーを返す
         if not delivery_note.company_name:
@@ -213,7 +330,7 @@ async def process_pdf(
         canonical_name = sheets_client.get_canonical_company_name(
             effective_company_name,
             year=target_year,
-            filename=file.filename,
+            filename=filename,
         )
         company_matched = True
         sheet_company_candidates = []
@@ -228,7 +345,7 @@ async def process_pdf(
             company_matched = False
             sheet_company_candidates = list_canonicals("sales")
             # ファイル名＋抽出会社名からキーワードを抽出してスコアリング
-            filename_keywords = _extract_filename_keywords(file.filename or "")
+            filename_keywords = _extract_filename_keywords(filename or "")
             scored = [
                 (name, _score_company_candidate(name, effective_company_name, filename_keywords))
                 for name in sheet_company_candidates
@@ -236,7 +353,7 @@ async def process_pdf(
             scored.sort(key=lambda x: x[1], reverse=True)
             suggested_company_candidates = [name for name, s in scored if s > 0]
             sheet_company_candidates = [name for name, _ in scored]
-            print(f"  会社名マッチなし: '{effective_company_name}' (file: {file.filename})")
+            print(f"  会社名マッチなし: '{effective_company_name}' (file: {filename})")
             print(f"  キーワード: {filename_keywords}, 類似候補: {[(n, s) for n, s in scored if s > 0]}")
         delivery_note.company_name = effective_company_name
 
@@ -344,7 +461,6 @@ async def process_pdf(
         )
 
     except Exception as e:
-        import traceback
         error_detail = {
             "error": str(e),
             "traceback": traceback.format_exc()
@@ -352,11 +468,6 @@ async def process_pdf(
         print(f"ERROR in process_pdf: {error_detail}")  # デバッグ用
         raise HTTPException(status_code=500, detail=error_detail)
 
-    finally:
-        # 一時ファイルを削除
-        if tmp_path.exists():
-            tmp_path.unlink()
-
 
 @router.post("/regenerate-invoice", response_model=RegenerateInvoiceResponse)
 async def regenerate_invoice(request: RegenerateInvoiceRequest):
@@ -403,8 +514,6 @@ async def regenerate_invoice(request: RegenerateInvoiceRequest):
         )
 
         # CompanyInfoオブジェクトを再構築
-        from src.sheets_client import CompanyInfo, PreviousBilling as PrevBilling
-
         company_info = None
         if request.company_info:
             company_info = CompanyInfo(
@@ -415,7 +524,7 @@ async def regenerate_invoice(request: RegenerateInvoiceRequest):
             )
 
         # PreviousBillingオブジェクトを再構築
-        previous_billing = PrevBilling(
+        previous_billing = PreviousBilling(
             previous_amount=request.previous_billing.previous_amount,
             payment_received=request.previous_billing.payment_received,
             carried_over=request.previous_billing.carried_over,
@@ -437,12 +546,30 @@ async def regenerate_invoice(request: RegenerateInvoiceRequest):
         if invoice_path.exists():
             invoice_path.unlink()
 
-        invoice_generator.generate(
-            delivery_note=delivery_note,
-            company_info=company_info,
-            previous_billing=previous_billing,
-            output_path=invoice_path,
-        )
+        # 同一内容の再生成はキャッシュ済みPDFを流用する
+        # （請求書番号が発行日由来のため、当日の日付もキーに含める。
+        #   自社情報・振込先は /api/company-config で変更できるので、その内容もキーに含める）
+        cache_dir = output_dir / ".cache"
+        cache_dir.mkdir(exist_ok=True)
+        cache_key = _invoice_cache_key({
+            "request": request.model_dump(),
+            "company_name": company_name,
+            "issued_on": datetime.now().strftime("%Y%m%d"),
+            "own_company": load_company_config(),
+        })
+        cached_path = cache_dir / f"{cache_key}.pdf"
+        if cached_path.exists():
+            os.utime(cached_path)  # LRU 用に最終利用時刻を更新
+            print(f"  請求書PDFキャッシュヒット: {cache_key}")
+        else:
+            invoice_generator.generate(
+                delivery_note=delivery_note,
+                company_info=company_info,
+                previous_billing=previous_billing,
+                output_path=cached_path,
+            )
+        _link_or_copy(cached_path, invoice_path)
+        _evict_invoice_cache(cache_dir)
 
         # キャッシュバスティング用にタイムスタンプを追加
         timestamp = int(time.time())
@@ -533,8 +660,6 @@ async def regenerate_group_invoice(request: RegenerateGroupInvoiceRequest):
             raise HTTPException(status_code=400, detail="delivery_notes が空です")
 
         # CompanyInfo / PreviousBilling 再構築
-        from src.sheets_client import CompanyInfo, PreviousBilling as PrevBilling
-
         company_info = None
         if request.company_info:
             company_info = CompanyInfo(
@@ -543,7 +668,7 @@ async def regenerate_group_invoice(request: RegenerateGroupInvoiceRequest):
                 address=request.company_info.address,
                 department=request.company_info.department,
             )
-        previous_billing = PrevBilling(
+        previous_billing = PreviousBilling(
             previous_amount=request.previous_billing.previous_amount,
             payment_received=request.previous_billing.payment_received,
             carried_over=request.previous_billing.carried_over,
@@ -581,7 +706,7 @@ async def regenerate_group_invoice(request: RegenerateGroupInvoiceRequest):
     except HTTPException:
         raise
     except Exception as e:
-        import traceback; traceback.print_exc()
+        traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -636,6 +761,9 @@ async def pdf_to_image(filename: str, page: int = 1):
         raise HTTPException(status_code=500, detail=f"画像変換エラー: {str(e)}")
 
 
+_PNG_DATA_URL_PREFIX = b"data:image/png;base64,"
+
+
 class PDFToImagesResponse(BaseModel):
     images: list[str]  # base64エンコードされた画像のリスト
     num_pages: int
@@ -656,8 +784,6 @@ async def pdf_to_images(
         raise HTTPException(status_code=404, detail="ファイルが見つかりません")
 
     try:
-        from pdf2image.pdf2image import pdfinfo_from_path
-
         # 総ページ数を軽量に取得
         info = pdfinfo_from_path(str(file_path))
         total_pages = info["Pages"]
@@ -676,14 +802,14 @@ async def pdf_to_images(
             last_page=end_page,
         )
 
-        # 各画像をbase64エンコード
+        # 各画像をbase64エンコード（バッファをコピーせず、data URL は bytes で組んで1回だけ decode）
         encoded_images = []
         for img in images:
             img_byte_arr = io.BytesIO()
             img.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)
-            encoded = base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
-            encoded_images.append(f"data:image/png;base64,{encoded}")
+            with img_byte_arr.getbuffer() as raw:
+                encoded = base64.b64encode(raw)
+            encoded_images.append((_PNG_DATA_URL_PREFIX + encoded).decode('ascii'))
 
         return PDFToImagesResponse(
             images=encoded_images,
@@ -721,8 +847,7 @@ async def generate_monthly_invoice(request: GenerateMonthlyInvoiceRequest):
     try:
         # 0. 会社名をスプレッドシートの正規名に統一
         company_name = request.company_name
-        import re
-        match = re.match(r'(\d+)年(\d+)月', request.year_month)
+        match = _YEAR_MONTH_RE.match(request.year_month)
         if match:
             target_year = int(match.group(1))
         else:
@@ -732,9 +857,7 @@ async def generate_monthly_invoice(request: GenerateMonthlyInvoiceRequest):
             company_name = canonical
 
         # 1. 月次明細DBからデータ取得
-        from src.database import MonthlyItemsDB
-
-        db = MonthlyItemsDB()
+        db = get_shared_db()
         delivery_notes = db.get_monthly_items(
             company_name=company_name,
             year_month=request.year_month,
@@ -751,7 +874,7 @@ async def generate_monthly_invoice(request: GenerateMonthlyInvoiceRequest):
         company_info = sheets_client.get_company_info(company_name)
 
         # 3. 前月の請求情報を取得（DB優先、空ならシートにフォールバック）
-        match = re.match(r'(\d+)年(\d+)月', request.year_month)
+        match = _YEAR_MONTH_RE.match(request.year_month)
         if match:
             year = match.group(1)
             month = match.group(2)
@@ -834,7 +957,6 @@ async def generate_monthly_invoice(request: GenerateMonthlyInvoiceRequest):
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
         error_detail = {
             "error": str(e),
             "traceback": traceback.format_exc()
@@ -851,7 +973,6 @@ class CompanyBillingInfoResponse(BaseModel):
 @router.get("/company-billing-info", response_model=CompanyBillingInfoResponse)
 async def get_company_billing_info(company_name: str, year_month: str):
     """指定した会社・年月の前月請求情報＋会社情報を取得"""
-    import unicodedata
     company_name = unicodedata.normalize('NFKC', company_name)
     canonical = sheets_client.get_canonical_company_name(company_name)
     if canonical:
@@ -883,9 +1004,7 @@ class DBCompaniesResponse(BaseModel):
 @router.get("/db-companies", response_model=DBCompaniesResponse)
 async def get_db_companies():
     """月次明細DBに保存されている会社名一覧を取得"""
-    from src.database import MonthlyItemsDB
-
-    db = MonthlyItemsDB()
+    db = get_shared_db()
     companies = db.get_distinct_companies()
     return DBCompaniesResponse(companies=companies)
 
@@ -897,9 +1016,7 @@ class DBSalesPersonsResponse(BaseModel):
 @router.get("/db-sales-persons", response_model=DBSalesPersonsResponse)
 async def get_db_sales_persons(company_name: str = ""):
     """月次明細DBに保存されている担当者名一覧を取得"""
-    from src.database import MonthlyItemsDB
-
-    db = MonthlyItemsDB()
+    db = get_shared_db()
     sales_persons = db.get_distinct_sales_persons(company_name=company_name)
     return DBSalesPersonsResponse(sales_persons=sales_persons)
 
@@ -1,18 +1,24 @@
 """仕入れ処理関連のエンドポイント"""
+import asyncio
+import functools
+import logging
+import os
 import re
 import tempfile
 import shutil
 import time
+from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Optional
 
-from fastapi import APIRouter, File, UploadFile, HTTPException, Query
+import anyio
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Query
 from pydantic import BaseModel
 
-from src.purchase_extractor import PurchaseExtractor, PurchaseInvoice, PurchaseItem
+from src.purchase_extractor import PurchaseExtractor, PurchaseInvoice
 from src import sheets_client
 from src.sheets_client import parse_amount, _find_company_row
-from src.database import MonthlyItemsDB
+from src.database import MonthlyItemsDB, get_shared_db
 from src.canonical_companies import (
     list_canonicals,
     get_purchase_taxability_hint,
@@ -28,6 +34,43 @@ def _purchase_ym_sort_key(year_month: str) -> tuple[int, int]:
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
+# アップロードをディスクへ書き出す際のチャンクサイズ
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# PDF抽出（ラスタライズ + Gemini 呼び出し）はワーカースレッドで実行し、イベントループを塞がない
+# 処理の大半は Gemini 応答待ち。300dpi のページ画像を保持するためメモリを考慮して同時実行数を絞る
+_PDF_EXTRACT_CONCURRENCY = max(1, int(os.getenv("PURCHASE_PDF_CONCURRENCY", "2")))
+_pdf_extract_semaphore = asyncio.Semaphore(_PDF_EXTRACT_CONCURRENCY)
+
+
+def _persist_upload(src: BinaryIO) -> Path:
+    """アップロード内容を一時ファイルへチャンクコピーしてパスを返す"""
+    src.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+        shutil.copyfileobj(src, tmp_file, _UPLOAD_CHUNK_SIZE)
+        return Path(tmp_file.name)
+
+
+def _move_or_copy(src: Path, dst: Path):
+    """一時ファイルはこの後削除するだけなので、コピーせずリネームで移す
+    （別ファイルシステムでリネームできない場合のみコピー）"""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+
+def _extract_purchase_invoices(pdf_path: str) -> list[PurchaseInvoice]:
+    """ワーカースレッド内で PurchaseExtractor を生成して抽出する"""
+    return PurchaseExtractor().extract_from_pdf(pdf_path)
+
+
+def get_db() -> MonthlyItemsDB:
+    """プロセス内で共有する MonthlyItemsDB を返す（Depends 用）"""
+    return get_shared_db()
+
 
 # --- レスポンス/リクエストモデル ---
 
@@ -161,13 +204,25 @@ class UpdatePurchaseNoteRequest(BaseModel):
 # --- ヘルパー ---
 
 def _extract_year_from_year_month(year_month: str) -> int:
-    match = re.match(r'(\d{4})', year_month)
-    if match:
-        return int(match.group(1))
-    from datetime import datetime
+    """'2026年3月' / '2026-03' の先頭4桁から年を取り出す（取れなければ今年）"""
+    head = year_month[:4]
+    if len(head) == 4 and head.isdecimal():
+        return int(head)
     return datetime.now().year
 
 
+_YM_RE = re.compile(r'^(\d{4})-(\d{1,2})')
+
+
+@functools.lru_cache(maxsize=512)
+def _normalize_year_month(ym: str) -> str:
+    """'2026-03' / '2026-03-01' → '2026年3月'（それ以外の形式はそのまま返す）"""
+    if '年' in ym:
+        return ym
+    m = _YM_RE.match(ym)
+    return f"{int(m[1])}年{int(m[2])}月" if m else ym
+
+
 def _convert_purchase_invoice(
     invoice: PurchaseInvoice,
     company_matched: bool = True,
@@ -207,15 +262,15 @@ async def process_purchase_pdf(file: UploadFile = File(...)):
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="PDFファイルのみアップロード可能です")
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_path = Path(tmp_file.name)
+    # PDF全体をメモリに載せず、チャンク単位で一時ファイルへ書き出す（ディスクI/Oはスレッドで）
+    tmp_path = await anyio.to_thread.run_sync(_persist_upload, file.file)
 
     try:
-        # 1. PDF抽出
-        extractor = PurchaseExtractor()
-        invoices = extractor.extract_from_pdf(str(tmp_path))
+        # 1. PDF抽出（ワーカースレッドで実行。同時実行数は PURCHASE_PDF_CONCURRENCY まで）
+        async with _pdf_extract_semaphore:
+            invoices = await anyio.to_thread.run_sync(
+                _extract_purchase_invoices, str(tmp_path)
+            )
 
         if not invoices:
             raise HTTPException(status_code=500, detail="PDFの抽出に失敗しました")
@@ -292,7 +347,7 @@ async def process_purchase_pdf(file: UploadFile = File(...)):
         date_str = (invoices[0].date or "").replace("/", "")
         purchase_filename = f"purchase_{safe_supplier_name}_{date_str}.pdf"
         purchase_path = output_dir / purchase_filename
-        shutil.copy(tmp_path, purchase_path)
+        await anyio.to_thread.run_sync(_move_or_copy, tmp_path, purchase_path)
 
         # 3. レスポンス作成
         timestamp = int(time.time())
@@ -323,21 +378,25 @@ async def process_purchase_pdf(file: UploadFile = File(...)):
 
 
 @router.post("/save-purchase")
-async def save_purchase(request: SavePurchaseRequest):
+async def save_purchase(request: SavePurchaseRequest, db: MonthlyItemsDB = Depends(get_db)):
     """仕入れデータをDB+シートに保存（2層保存）"""
 
     try:
-        print(f"[save-purchase] 受信: {len(request.purchase_notes)}件の納品書, 会社={request.company_name}, 年月={request.year_month}")
-        for i, note in enumerate(request.purchase_notes):
-            print(
-                f"  [{i}] slip={note.slip_number}, subtotal={note.subtotal}, "
-                f"tax={note.tax}, total={note.total}, "
-                f"is_taxable={note.is_taxable}, detected_indicators={note.detected_indicators}"
+        # 受信内容のデバッグログ（本番では無効。無効時は文字列を組み立てない）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"[save-purchase] 受信: {len(request.purchase_notes)}件の納品書, "
+                f"会社={request.company_name}, 年月={request.year_month}"
             )
+            for i, note in enumerate(request.purchase_notes):
+                logger.debug(
+                    f"  [{i}] slip={note.slip_number}, subtotal={note.subtotal}, "
+                    f"tax={note.tax}, total={note.total}, "
+                    f"is_taxable={note.is_taxable}, detected_indicators={note.detected_indicators}"
+                )
 
-        db = MonthlyItemsDB()
-
-        # 1. 冪等性チェック
+        # 1. 冪等性チェック（同一プロセス内の再送は IdempotencyMiddleware が先に返す。
+        #    ここはワーカー再起動・複数ワーカー時の保険）
         if request.request_id and db.check_request_id(request.request_id):
             return SavePurchaseResponse(
                 success=True,
@@ -364,28 +423,13 @@ async def save_purchase(request: SavePurchaseRequest):
         company_name = canonical
 
         # 3. 年月フォーマット変換
-        year_month_str = request.year_month
-        if '-' in year_month_str and '年' not in year_month_str:
-            parts = year_month_str.split('-')
-            year_month_str = f"{int(parts[0])}年{int(parts[1])}月"
+        year_month_str = _normalize_year_month(request.year_month)
 
-        # 4. PurchaseInvoiceオブジェクトリストを構築
+        # 4. 課税区分を補正（リクエストモデルをそのまま DB 保存に渡す）
         # Phase 5d': save 時にも canonical 化済 company_name を使って Layer 2/3 を再適用する。
         # process-pdf 段階で canonical 化失敗してピッカー選択された invoice は、選択時点で
         # supplier_name は更新されたが is_taxable は LLM 判定のままなので、ここで補正する。
-        purchase_invoices = []
         for note_req in request.purchase_notes:
-            items = [
-                PurchaseItem(
-                    product_code=item.product_code,
-                    product_name=item.product_name,
-                    quantity=item.quantity,
-                    unit_price=item.unit_price,
-                    amount=item.amount,
-                )
-                for item in note_req.items
-            ]
-
             # Layer 2: シート固定の hint があれば上書き
             is_taxable = note_req.is_taxable
             hint = get_purchase_taxability_hint(company_name)
@@ -412,25 +456,26 @@ async def save_purchase(request: SavePurchaseRequest):
                     )
                 is_taxable = final_taxable
 
-            purchase_invoices.append(PurchaseInvoice(
-                date=note_req.date,
-                supplier_name=company_name,
-                slip_number=note_req.slip_number,
-                items=items,
-                subtotal=note_req.subtotal,
-                tax=note_req.tax,
-                total=note_req.total,
-                is_taxable=is_taxable,
-                detected_indicators=note_req.detected_indicators,
-            ))
-
-        # 5. 重複チェック
-        if not request.force_overwrite:
-            slip_numbers = [pi.slip_number for pi in purchase_invoices if pi.slip_number]
-            existing = db.find_existing_purchase_slip_numbers(
+            note_req.is_taxable = is_taxable
+
+        purchase_invoices = request.purchase_notes
+
+        # 5. 重複チェック + 6. DB一括保存（同一トランザクション）
+        if request.force_overwrite:
+            saved_count = db.save_purchase_batch(
                 company_name=company_name,
                 year_month=year_month_str,
-                slip_numbers=slip_numbers,
+                purchase_invoices=purchase_invoices,
+                sales_person=request.sales_person,
+                request_id=request.request_id,
+            )
+        else:
+            saved_count, existing = db.save_purchase_batch_if_absent(
+                company_name=company_name,
+                year_month=year_month_str,
+                purchase_invoices=purchase_invoices,
+                sales_person=request.sales_person,
+                request_id=request.request_id,
             )
             if existing:
                 return SavePurchaseResponse(
@@ -440,15 +485,6 @@ async def save_purchase(request: SavePurchaseRequest):
                     message="以下の伝票番号は既にDBに保存されています",
                 )
 
-        # 6. Layer 1: DB一括保存（DB-as-truth: シート障害でもDBは保持）
-        saved_count = db.save_purchase_batch(
-            company_name=company_name,
-            year_month=year_month_str,
-            purchase_invoices=purchase_invoices,
-            sales_person=request.sales_person,
-            request_id=request.request_id,
-        )
-
         # DB が唯一の真値（シート書込は廃止）
         message = f"DB保存成功（{saved_count}件）。{company_name} ({request.year_month}) を更新しました。"
 
@@ -468,7 +504,7 @@ async def save_purchase(request: SavePurchaseRequest):
 
 
 @router.post("/update-purchase-payment", response_model=UpdatePurchasePaymentResponse)
-async def update_purchase_payment(request: UpdatePurchasePaymentRequest):
+async def update_purchase_payment(request: UpdatePurchasePaymentRequest, db: MonthlyItemsDB = Depends(get_db)):
     """仕入入金（消滅）を更新
 
     Phase 1: DB を source of truth として upsert 後、シート書込みを best-effort で実行。
@@ -476,8 +512,6 @@ async def update_purchase_payment(request: UpdatePurchasePaymentRequest):
     """
 
     try:
-        db = MonthlyItemsDB()
-
         # Layer 1: DB upsert（previous_value は upsert 前の DB 値、new_value は upsert 後の DB 値）
         prev = db.get_purchase_payment(request.company_name, request.year_month)
         previous_value = (prev or {}).get("payment_amount", 0)
@@ -510,14 +544,12 @@ async def update_purchase_payment(request: UpdatePurchasePaymentRequest):
 
 
 @router.get("/purchase-companies-and-months", response_model=PurchaseCompaniesAndMonthsResponse)
-async def get_purchase_companies_and_months():
+async def get_purchase_companies_and_months(db: MonthlyItemsDB = Depends(get_db)):
     """仕入先リストと年月リストを取得（DB由来）
 
     会社 = 仕入先マスタ(有効) ∪ 取引実績。年月 = 仕入伝票 or 入金が存在する年月。
     """
     try:
-        db = MonthlyItemsDB()
-
         master = [c["canonical_name"] for c in db.list_companies("purchase")]
         seen = set(master)
         companies = list(master)
@@ -540,10 +572,9 @@ async def get_purchase_companies_and_months():
 
 
 @router.get("/purchase-db-companies")
-async def get_purchase_db_companies():
+async def get_purchase_db_companies(db: MonthlyItemsDB = Depends(get_db)):
     """仕入れDBの会社一覧を取得"""
     try:
-        db = MonthlyItemsDB()
         companies = db.get_purchase_companies()
         return {"companies": companies}
     except Exception as e:
@@ -551,10 +582,9 @@ async def get_purchase_db_companies():
 
 
 @router.get("/purchase-db-sales-persons")
-async def get_purchase_db_sales_persons(company_name: str = ""):
+async def get_purchase_db_sales_persons(company_name: str = "", db: MonthlyItemsDB = Depends(get_db)):
     """仕入れDBの担当者一覧を取得"""
     try:
-        db = MonthlyItemsDB()
         sales_persons = db.get_purchase_sales_persons(company_name)
         return {"sales_persons": sales_persons}
     except Exception as e:
@@ -566,16 +596,12 @@ async def get_purchase_monthly(
     company_name: str = Query(""),
     year_month: str = Query(""),
     sales_person: str = Query(""),
+    db: MonthlyItemsDB = Depends(get_db),
 ):
     """仕入れ月次一覧データを取得"""
     try:
-        db = MonthlyItemsDB()
-
         # year_month を "YYYY年M月" 形式に変換
-        ym = year_month
-        if '-' in ym and '年' not in ym:
-            parts = ym.split('-')
-            ym = f"{int(parts[0])}年{int(parts[1])}月"
+        ym = _normalize_year_month(year_month)
 
         items = db.get_purchase_items(
             company_name=company_name,
@@ -588,10 +614,9 @@ async def get_purchase_monthly(
 
 
 @router.get("/purchase-table", response_model=PurchaseTableResponse)
-async def get_purchase_table():
+async def get_purchase_table(db: MonthlyItemsDB = Depends(get_db)):
     """仕入れ集計表を DB から再構築（仕入先×月: 課税/非課税の発生・消費税 + 消滅）"""
     try:
-        db = MonthlyItemsDB()
         totals = db.get_all_purchase_monthly_totals()
         payments = db.list_purchase_payments()
 
@@ -638,26 +663,22 @@ async def get_purchase_table():
 async def get_purchase_delivery_notes(
     company_name: str = Query(...),
     year_month: str = Query(...),
+    db: MonthlyItemsDB = Depends(get_db),
 ):
     """仕入れDBの納品書一覧（ID付き）を取得"""
     try:
-        db = MonthlyItemsDB()
-        ym = year_month
-        if '-' in ym and '年' not in ym:
-            parts = ym.split('-')
-            ym = f"{int(parts[0])}年{int(parts[1])}月"
+        ym = _normalize_year_month(year_month)
 
         notes = db.get_purchase_notes_with_ids(company_name, ym)
-        return {"notes": [PurchaseDeliveryNoteOut(**n) for n in notes]}
+        return {"notes": [PurchaseDeliveryNoteOut(**n._asdict()) for n in notes]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.put("/purchase-delivery-notes/{note_id}")
-async def update_purchase_delivery_note(note_id: int, request: UpdatePurchaseNoteRequest):
+async def update_purchase_delivery_note(note_id: int, request: UpdatePurchaseNoteRequest, db: MonthlyItemsDB = Depends(get_db)):
     """仕入れ納品書の金額を更新"""
     try:
-        db = MonthlyItemsDB()
         db.update_purchase_note_amounts(
             note_id, request.subtotal, request.tax, request.total
         )
@@ -667,10 +688,9 @@ async def update_purchase_delivery_note(note_id: int, request: UpdatePurchaseNot
 
 
 @router.delete("/purchase-delivery-notes/{note_id}")
-async def delete_purchase_delivery_note(note_id: int):
+async def delete_purchase_delivery_note(note_id: int, db: MonthlyItemsDB = Depends(get_db)):
     """仕入れ納品書（伝票）を削除（ダブり解消用）"""
     try:
-        db = MonthlyItemsDB()
         deleted = db.delete_purchase_note(note_id)
         if not deleted:
             raise HTTPException(status_code=404, detail="対象の伝票が見つかりません")
@@ -206,7 +206,10 @@ export const processPurchasePDF = async (
 export const savePurchase = async (
   data: SavePurchaseRequest
 ): Promise<SavePurchaseResponse> => {
-  const response = await apiClient.post<SavePurchaseResponse>('/save-purchase', data);
+  // request_id を Idempotency-Key として送り、再送はサーバ側で初回レスポンスを返させる
+  const response = await apiClient.post<SavePurchaseResponse>('/save-purchase', data, {
+    headers: data.request_id ? { 'Idempotency-Key': data.request_id } : undefined,
+  });
   return response.data;
 };
 
@@ -1,20 +1,26 @@
 """OAuth 2.0認証を事前に設定するスクリプト"""
 import os
-import pickle
 from pathlib import Path
+
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+    "https://www.googleapis.com/auth/cloud-vision",
+]
+
+TOKEN_PATH = Path("token.json")
+
 
 def setup_oauth():
-    """OAuth 2.0 認証を実行してtoken.pickleを生成"""
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-        "https://www.googleapis.com/auth/cloud-vision",
-    ]
+    """OAuth 2.0 認証を実行してtoken.jsonを生成"""
+    scopes = SCOPES
 
     credentials_path = Path("credentials.json")
-    token_path = Path("token.pickle")
+    token_path = TOKEN_PATH
 
     if not credentials_path.exists():
         print("❌ エラー: credentials.json が見つかりません")
@@ -27,8 +33,7 @@ def setup_oauth():
     # 既存のトークンを確認
     if token_path.exists():
         print("既存の認証トークンが見つかりました。")
-        with open(token_path, "rb") as token:
-            credentials = pickle.load(token)
+        credentials = Credentials.from_authorized_user_file(str(token_path), scopes)
 
     # トークンが無効または存在しない場合は再認証
     if not credentials or not credentials.valid:
@@ -56,11 +61,11 @@ def setup_oauth():
                 prompt='consent'
             )
 
-        # トークンを保存
-        with open(token_path, "wb") as token:
-            pickle.dump(credentials, token)
+        # トークンを保存（pickle ではなく JSON）
+        with open(token_path, "w") as token:
+            token.write(credentials.to_json())
 
-        print("✅ 認証成功！token.pickle を生成しました。")
+        print("✅ 認証成功！token.json を生成しました。")
     else:
         print("✅ 既存の認証トークンは有効です。")
 
@@ -237,6 +237,19 @@ check("消滅更新後も opening_balance 保持", r.json().get("opening_balance
       f"got={r.json().get('opening_balance')}")
 
 
+# ---------------------------------------------------------------------------
+# 8. 仕入れ API の年月正規化
+# ---------------------------------------------------------------------------
+section("8. 仕入れ年月の正規化")
+
+from routes.purchase import _normalize_year_month  # noqa: E402
+
+check("YYYY-MM → YYYY年M月", _normalize_year_month("2026-03") == "2026年3月")
+check("YYYY-MM-DD → YYYY年M月", _normalize_year_month("2026-03-01") == "2026年3月",
+      f"got={_normalize_year_month('2026-03-01')}")
+check("YYYY年M月 はそのまま", _normalize_year_month("2026年3月") == "2026年3月")
+
+
 # ---------------------------------------------------------------------------
 # まとめ
 # ---------------------------------------------------------------------------
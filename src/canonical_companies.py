@@ -15,7 +15,10 @@ section header（【ライフスタイル】、合計 等）は手動で除外
 """
 from __future__ import annotations
 
-from typing import Final, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Final, Optional
 
 # ===== 売上 (sales) canonical company list =====
 # 売上集計表 Column A の会社名（57件、2026年時点）
@@ -295,6 +298,74 @@ PURCHASE_TAXABILITY: Final[dict[str, bool]] = {
 }
 
 
+# ===== company_master 由来の参照結果キャッシュ =====
+# マスタはほぼ静的なのにリクエストごと（伝票ごと）にDBを引いていたため、短時間だけ保持する。
+# マスタ編集エンドポイントからは clear_company_master_caches() で即時無効化する。
+
+COMPANY_MASTER_CACHE_TTL_SECONDS: Final[int] = 300
+# 1キャッシュあたりの上限件数（仕入れはアップロードファイル名もキーに含むため、上限が無いと増え続ける）
+COMPANY_MASTER_CACHE_MAX_ENTRIES: Final[int] = 1024
+
+CACHE_MISS: Final = object()
+
+
+class _TTLCache:
+    """有効期限・件数上限付きの簡易 LRU キャッシュ（None も値としてキャッシュする）"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = COMPANY_MASTER_CACHE_TTL_SECONDS,
+        max_entries: int = COMPANY_MASTER_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return CACHE_MISS
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return CACHE_MISS
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Any, value: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (now + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            # 上限を超えたら最終利用が古いものから捨てる
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_COMPANY_MASTER_CACHES: list[_TTLCache] = []
+
+
+def company_master_cache() -> _TTLCache:
+    """company_master 由来のキャッシュを生成（clear_company_master_caches の対象に登録）"""
+    cache = _TTLCache()
+    _COMPANY_MASTER_CACHES.append(cache)
+    return cache
+
+
+def clear_company_master_caches() -> None:
+    """company_master を更新したときに呼ぶ（参照結果キャッシュを全て破棄）"""
+    for cache in _COMPANY_MASTER_CACHES:
+        cache.clear()
+
+
+_taxability_hint_cache = company_master_cache()
+
+
 def get_purchase_taxability_hint(canonical_name: str) -> Optional[bool]:
     """canonical 名から課税/非課税のデフォルトを取得
 
@@ -306,14 +377,22 @@ def get_purchase_taxability_hint(canonical_name: str) -> Optional[bool]:
         False: 非課税が確定している会社
         None: 曖昧（混在しうる、付属系等）→ LLM 抽出値を尊重 + ユーザ手動編集に委ねる
     """
+    cached = _taxability_hint_cache.get(canonical_name)
+    if cached is not CACHE_MISS:
+        return cached
     try:
-        from .database import MonthlyItemsDB
-        company = MonthlyItemsDB().get_company("purchase", canonical_name)
+        from .database import get_shared_db
+        company = get_shared_db().get_company("purchase", canonical_name)
         if company is not None:
+            _taxability_hint_cache.set(canonical_name, company["taxable"])
             return company["taxable"]  # bool または None（曖昧）
     except Exception as e:
+        # DB 失敗時のフォールバック値はキャッシュしない（復旧後すぐ DB 値に戻す）
         print(f"    [company_master] taxability DB読込失敗、ハードコードにフォールバック: {e}")
-    return PURCHASE_TAXABILITY.get(canonical_name)
+        return PURCHASE_TAXABILITY.get(canonical_name)
+    hint = PURCHASE_TAXABILITY.get(canonical_name)
+    _taxability_hint_cache.set(canonical_name, hint)
+    return hint
 
 
 # ===== Phase 5b' (Layer 3): 課税/非課税が混在する会社の動的判別ルール =====
@@ -436,8 +515,8 @@ def list_canonicals(domain: str = "sales") -> list[str]:
     """
     fallback = _hardcoded_canonicals(domain)
     try:
-        from .database import MonthlyItemsDB
-        names = MonthlyItemsDB().list_company_canonicals(domain)
+        from .database import get_shared_db
+        names = get_shared_db().list_company_canonicals(domain)
         return names if names else fallback
     except Exception as e:
         print(f"    [company_master] canonical DB読込失敗、ハードコードにフォールバック: {e}")
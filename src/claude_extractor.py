@@ -10,16 +10,14 @@ from __future__ import annotations
 import base64
 import json
 import time
-from io import BytesIO
 from pathlib import Path
 from typing import Optional
 
 import anthropic
-from pdf2image import convert_from_path
 from PIL import Image
 
 from .config import ANTHROPIC_API_KEY, CLAUDE_MODEL, load_company_config
-from .llm_extractor import EXTRACTION_PROMPT
+from .llm_extractor import EXTRACTION_PROMPT, ExtractionCache, encode_jpeg, pdf_to_images
 from .pdf_extractor import DeliveryItem, DeliveryNote
 
 
@@ -31,10 +29,12 @@ class ClaudeExtractor:
         api_key: Optional[str] = None,
         model: Optional[str] = None,
         max_tokens: int = 16384,
+        cache: Optional[ExtractionCache] = None,
     ):
         self.api_key = api_key or ANTHROPIC_API_KEY
         self.model = model or CLAUDE_MODEL
         self.max_tokens = max_tokens
+        self.cache = cache
 
         if not self.api_key:
             raise ValueError(
@@ -45,6 +45,19 @@ class ClaudeExtractor:
 
     def extract(self, pdf_path: Path) -> DeliveryNote:
         """PDFから納品書データを抽出"""
+        cache_key = self.cache.key(pdf_path, self.model) if self.cache else None
+        extracted = self.cache.get(cache_key) if cache_key else None
+        if extracted is not None:
+            print(f"  抽出キャッシュにヒット: {cache_key[:12]}")
+        else:
+            extracted = self._extract_raw(pdf_path)
+            if cache_key:
+                self.cache.put(cache_key, extracted)
+
+        return self._postprocess(extracted)
+
+    def _extract_raw(self, pdf_path: Path):
+        """PDFを画像化してClaudeで抽出し、応答JSON（dict または list）をそのまま返す"""
         images = self._pdf_to_images(pdf_path)
         print(f"  PDF → {len(images)} ページの画像に変換 (Claude/{self.model})")
 
@@ -59,7 +72,10 @@ class ClaudeExtractor:
 
         if not extracted:
             raise ValueError(f"データの抽出に失敗しました（{max_retries}回リトライ後）")
+        return extracted
 
+    def _postprocess(self, extracted) -> DeliveryNote:
+        """Claudeの応答JSONを検証・整形してDeliveryNoteに変換"""
         if isinstance(extracted, list):
             print(f"  ⚠️ Claudeがリスト({len(extracted)}件)を返却 → 1件にマージ")
             merged: dict = extracted[0] if extracted else {}
@@ -131,13 +147,11 @@ class ClaudeExtractor:
         return self._to_delivery_note(merged_data, extracted.get("items", []))
 
     def _pdf_to_images(self, pdf_path: Path) -> list[Image.Image]:
-        return convert_from_path(str(pdf_path), dpi=300)
+        return pdf_to_images(pdf_path)
 
     @staticmethod
     def _image_to_b64(image: Image.Image) -> str:
-        buf = BytesIO()
-        image.save(buf, format="PNG")
-        return base64.standard_b64encode(buf.getvalue()).decode("ascii")
+        return base64.standard_b64encode(encode_jpeg(image)).decode("ascii")
 
     def _extract_with_claude(self, images: list[Image.Image]) -> Optional[dict]:
         try:
@@ -148,16 +162,23 @@ class ClaudeExtractor:
                         "type": "image",
                         "source": {
                             "type": "base64",
-                            "media_type": "image/png",
+                            "media_type": "image/jpeg",
                             "data": self._image_to_b64(img),
                         },
                     }
                 )
-            content.append({"type": "text", "text": EXTRACTION_PROMPT})
 
+            # 静的プロンプトは system に置いてプロンプトキャッシュの対象にする
             resp = self.client.messages.create(
                 model=self.model,
                 max_tokens=self.max_tokens,
+                system=[
+                    {
+                        "type": "text",
+                        "text": EXTRACTION_PROMPT,
+                        "cache_control": {"type": "ephemeral"},
+                    }
+                ],
                 messages=[{"role": "user", "content": content}],
             )
             text = ""
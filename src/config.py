@@ -1,7 +1,10 @@
 """設定ファイル"""
+import functools
 import os
 import json
 from pathlib import Path
+
+import orjson
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -31,12 +34,27 @@ PURCHASE_SPREADSHEET_ID = os.getenv("PURCHASE_SPREADSHEET_ID", "")
 PURCHASE_SHEET_NAME = os.getenv("PURCHASE_SHEET_NAME", "仕入れ管理")
 
 # 自社情報（JSON管理）
+@functools.lru_cache(maxsize=1)
+def _read_company_config(mtime_ns: int) -> dict:
+    """company_config.json をパース（更新時刻をキーにキャッシュ）"""
+    with open(COMPANY_CONFIG_PATH, 'rb') as f:
+        return orjson.loads(f.read())
+
+
 def load_company_config() -> dict:
-    """自社情報をJSONファイルから読み込む"""
-    if COMPANY_CONFIG_PATH.exists():
+    """自社情報をJSONファイルから読み込む
+
+    ファイルの更新時刻が変わらない限り、前回パースした結果を返す
+    （別プロセスでの保存も更新時刻で検知できる）。返り値は変更しないこと。
+    """
+    try:
+        mtime_ns = COMPANY_CONFIG_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = None
+
+    if mtime_ns is not None:
         try:
-            with open(COMPANY_CONFIG_PATH, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return _read_company_config(mtime_ns)
         except Exception as e:
             print(f"警告: company_config.jsonの読み込みエラー: {e}")
 
@@ -55,11 +73,17 @@ def load_company_config() -> dict:
     return default_config
 
 
+def reload_company_config() -> None:
+    """自社情報のキャッシュを破棄（次回の load_company_config でファイルを読み直す）"""
+    _read_company_config.cache_clear()
+
+
 def save_company_config(config: dict) -> bool:
     """自社情報をJSONファイルに保存"""
     try:
         with open(COMPANY_CONFIG_PATH, 'w', encoding='utf-8') as f:
             json.dump(config, f, ensure_ascii=False, indent=2)
+        reload_company_config()
         return True
     except Exception as e:
         print(f"エラー: company_config.jsonの保存エラー: {e}")
@@ -1,47 +1,309 @@
 """SQLiteデータベース管理モジュール（正規化3テーブル構造）"""
+import atexit
+import os
 import sqlite3
-import json
+import threading
 from datetime import datetime
+from itertools import groupby
+from operator import attrgetter, itemgetter
 from pathlib import Path
-from typing import Optional
+from typing import NamedTuple, Optional, Sequence
 from contextlib import contextmanager
 
+import orjson
+
 from .config import DATABASE_PATH, DATA_DIR
 from .pdf_extractor import DeliveryNote, DeliveryItem
-from .purchase_extractor import PurchaseInvoice, PurchaseItem
+from .purchase_extractor import PurchaseInvoiceLike, PurchaseItem
 from .sheets_client import normalize_company_name, match_company_name
 
 
+# 担当者名から空白を除去する変換テーブル（str.split() が区切る Unicode 空白と同じ集合）
+_WS_TABLE = str.maketrans("", "", (
+    "\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680"
+    "\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a"
+    "\u2028\u2029\u202f\u205f\u3000"
+))
+
+# 検索用の非ユニークインデックス（旧テーブル移行中は外して挿入後に作り直す）
+_SECONDARY_INDEXES = {
+    "idx_monthly_invoices_ym_company": """
+        CREATE INDEX IF NOT EXISTS idx_monthly_invoices_ym_company
+        ON monthly_invoices(year_month, company_name)
+    """,
+    "idx_monthly_invoices_ym_norm": """
+        CREATE INDEX IF NOT EXISTS idx_monthly_invoices_ym_norm
+        ON monthly_invoices(year_month, normalized_company_name)
+    """,
+    "idx_delivery_notes_invoice_id": """
+        CREATE INDEX IF NOT EXISTS idx_delivery_notes_invoice_id
+        ON delivery_notes(monthly_invoice_id)
+    """,
+    # get_all_monthly_totals の SUM(subtotal), SUM(tax) をテーブル参照なしで集計する
+    "idx_delivery_notes_invoice_totals": """
+        CREATE INDEX IF NOT EXISTS idx_delivery_notes_invoice_totals
+        ON delivery_notes(monthly_invoice_id, subtotal, tax)
+    """,
+    # 会社で絞った担当者一覧（get_distinct_sales_persons）を伝票テーブルを走査せずに引く
+    "idx_delivery_notes_invoice_sales": """
+        CREATE INDEX IF NOT EXISTS idx_delivery_notes_invoice_sales
+        ON delivery_notes(monthly_invoice_id, sales_person)
+    """,
+    "idx_delivery_items_note_id": """
+        CREATE INDEX IF NOT EXISTS idx_delivery_items_note_id
+        ON delivery_items(delivery_note_id)
+    """,
+}
+
+# 明細（DeliveryItem / PurchaseItemLike）から INSERT 用の列を1回の呼び出しで取り出す
+_ITEM_FIELDS = attrgetter("product_code", "product_name", "quantity", "unit_price", "amount")
+
+# 旧テーブル移行時に明細をまとめて INSERT する件数
+_MIGRATION_ITEM_BATCH_SIZE = 1000
+
+# 読み取り結果キャッシュ（スレッドごと。get_monthly_items・会社/担当者一覧）の最大件数
+_READ_CACHE_MAXSIZE = 64
+
+# 保存・取得のホットパスで使う SQL（接続ごとのステートメントキャッシュで再利用される）
+_SQL_FIND_INVOICE_EXACT = """
+    SELECT id, company_name FROM monthly_invoices
+    WHERE year_month = ? AND company_name = ?
+"""
+_SQL_FIND_INVOICE_NORMALIZED = """
+    SELECT id, company_name FROM monthly_invoices
+    WHERE year_month = ? AND normalized_company_name = ?
+    LIMIT 2
+"""
+_SQL_SELECT_INVOICES_IN_MONTH = """
+    SELECT id, company_name FROM monthly_invoices
+    WHERE year_month = ?
+"""
+_SQL_INSERT_INVOICE = """
+    INSERT INTO monthly_invoices
+    (year_month, company_name, normalized_company_name, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+_SQL_RENAME_INVOICE = """
+    UPDATE monthly_invoices
+    SET company_name = ?, normalized_company_name = ?, updated_at = ?
+    WHERE id = ?
+"""
+_SQL_TOUCH_INVOICE = "UPDATE monthly_invoices SET updated_at = ? WHERE id = ?"
+_SQL_UPSERT_NOTE = """
+    INSERT INTO delivery_notes
+    (monthly_invoice_id, slip_number, date, sales_person,
+     subtotal, tax, total, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(monthly_invoice_id, slip_number) DO UPDATE SET
+        date = excluded.date,
+        sales_person = excluded.sales_person,
+        subtotal = excluded.subtotal,
+        tax = excluded.tax,
+        total = excluded.total,
+        updated_at = excluded.updated_at
+    RETURNING id, created_at
+"""
+_SQL_UPSERT_PURCHASE_NOTE = """
+    INSERT INTO purchase_notes
+    (purchase_invoice_id, slip_number, date, sales_person,
+     subtotal, tax, total, is_taxable, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(purchase_invoice_id, slip_number) DO UPDATE SET
+        date = excluded.date,
+        sales_person = excluded.sales_person,
+        subtotal = excluded.subtotal,
+        tax = excluded.tax,
+        total = excluded.total,
+        is_taxable = excluded.is_taxable,
+        updated_at = excluded.updated_at
+    RETURNING id
+"""
+_SQL_INSERT_PURCHASE_INVOICE = """
+    INSERT INTO purchase_invoices
+    (year_month, company_name, normalized_company_name, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+_SQL_RENAME_PURCHASE_INVOICE = """
+    UPDATE purchase_invoices
+    SET company_name = ?, normalized_company_name = ?, updated_at = ?
+    WHERE id = ?
+"""
+_SQL_FIND_PURCHASE_INVOICE_NORMALIZED = """
+    SELECT id, company_name FROM purchase_invoices
+    WHERE year_month = ? AND normalized_company_name = ?
+    LIMIT 2
+"""
+_SQL_TOUCH_PURCHASE_INVOICE = "UPDATE purchase_invoices SET updated_at = ? WHERE id = ?"
+_SQL_INSERT_PURCHASE_ITEM = """
+    INSERT INTO purchase_items
+    (purchase_note_id, product_code, product_name,
+     quantity, unit_price, amount)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+_SQL_DELETE_PURCHASE_NOTE_ITEMS = "DELETE FROM purchase_items WHERE purchase_note_id = ?"
+_SQL_CHECK_REQUEST_ID = (
+    "SELECT EXISTS(SELECT 1 FROM save_requests WHERE request_id = ?)"
+)
+_SQL_RECORD_REQUEST_ID = (
+    "INSERT OR IGNORE INTO save_requests (request_id, created_at) VALUES (?, ?)"
+)
+_SQL_SELECT_NOTE_ITEMS = """
+    SELECT id, product_code, product_name, quantity, unit_price, amount
+    FROM delivery_items
+    WHERE delivery_note_id = ?
+    ORDER BY id
+"""
+_SQL_UPDATE_ITEM = """
+    UPDATE delivery_items
+    SET product_code = ?, product_name = ?, quantity = ?, unit_price = ?, amount = ?
+    WHERE id = ?
+"""
+_SQL_DELETE_ITEM = "DELETE FROM delivery_items WHERE id = ?"
+_SQL_INSERT_ITEM = """
+    INSERT INTO delivery_items
+    (delivery_note_id, product_code, product_name,
+     quantity, unit_price, amount)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+_SQL_SELECT_NOTES_WITH_ITEMS = """
+    SELECT n.id AS note_id, n.slip_number, n.date,
+           n.subtotal, n.tax, n.total,
+           i.id AS item_id, i.product_code, i.product_name,
+           i.quantity, i.unit_price, i.amount
+    FROM delivery_notes n
+    LEFT JOIN delivery_items i ON i.delivery_note_id = n.id
+    WHERE n.monthly_invoice_id = ?
+"""
+_SQL_SELECT_NOTES_WITH_ITEMS_ALL = _SQL_SELECT_NOTES_WITH_ITEMS + " ORDER BY n.id, i.id"
+_SQL_SELECT_NOTES_WITH_ITEMS_BY_PERSON = (
+    _SQL_SELECT_NOTES_WITH_ITEMS + " AND n.sales_person = ? ORDER BY n.id, i.id"
+)
+_SQL_SELECT_PURCHASE_NOTES_WITH_ITEMS = """
+    SELECT n.id AS note_id, n.slip_number, n.date, n.sales_person,
+           n.subtotal, n.tax, n.total, n.is_taxable,
+           i.id AS item_id, i.product_code, i.product_name,
+           i.quantity, i.unit_price, i.amount
+    FROM purchase_notes n
+    LEFT JOIN purchase_items i ON i.purchase_note_id = n.id
+    WHERE n.purchase_invoice_id = ?
+"""
+_SQL_SELECT_PURCHASE_NOTES_WITH_ITEMS_ALL = (
+    _SQL_SELECT_PURCHASE_NOTES_WITH_ITEMS + " ORDER BY n.id, i.id"
+)
+_SQL_SELECT_PURCHASE_NOTES_WITH_ITEMS_BY_PERSON = (
+    _SQL_SELECT_PURCHASE_NOTES_WITH_ITEMS + " AND n.sales_person = ? ORDER BY n.id, i.id"
+)
+
+
+class DeliveryNoteRow(NamedTuple):
+    """編集画面用の納品書1行（get_delivery_notes_with_ids の戻り値）"""
+    id: int
+    slip_number: str
+    date: str
+    subtotal: int
+    tax: int
+    total: int
+
+
+class PurchaseNoteRow(NamedTuple):
+    """編集画面用の仕入れ納品書1行（get_purchase_notes_with_ids の戻り値）"""
+    id: int
+    slip_number: str
+    date: str
+    subtotal: int
+    tax: int
+    total: int
+    is_taxable: bool
+
+
 class MonthlyItemsDB:
     """月次明細データベース管理クラス"""
 
     def __init__(self, db_path: Optional[Path] = None):
         self.db_path = db_path or DATABASE_PATH
+        # 接続はスレッドごとに1本を使い回す（呼び出しごとの connect/PRAGMA を避ける）
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
         self._ensure_db_directory()
         self._init_database()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """このインスタンスが開いた全スレッドの接続を閉じる"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
     def _ensure_db_directory(self):
         """データベースディレクトリが存在することを確認"""
         DATA_DIR.mkdir(exist_ok=True)
 
-    @contextmanager
-    def _get_connection(self):
-        """データベース接続のコンテキストマネージャー"""
-        conn = sqlite3.connect(self.db_path)
+    def _connect(self) -> sqlite3.Connection:
+        """新しい接続を開いて接続単位の PRAGMA を設定"""
+        # close() を別スレッドから呼べるように check_same_thread=False
+        # （接続自体はスレッドローカルに保持し、スレッド間では共有しない）
+        # 定型SQLの再パースを避けるためステートメントキャッシュを既定(128)より広げる
+        conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, cached_statements=256,
+        )
         conn.row_factory = sqlite3.Row
         conn.execute("PRAGMA foreign_keys = ON")
+        # WAL 前提で commit ごとの fsync を WAL 追記のみに抑える（接続単位の設定）
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -20000")  # 約20MB
+        # 読み取りはメモリマップ経由でページコピーを省く（mmap 非対応環境では無視される）
+        conn.execute("PRAGMA mmap_size = 268435456")  # 256MB
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _thread_connection(self) -> sqlite3.Connection:
+        """現在のスレッド用の接続を返す（fork 後の子プロセスでは開き直す）"""
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is None or local.pid != os.getpid():
+            conn = self._connect()
+            local.conn = conn
+            local.pid = os.getpid()
+            local.read_cache = {}
+        return conn
+
+    @contextmanager
+    def _get_connection(self, write: bool = False):
+        """データベース接続のコンテキストマネージャー
+
+        スレッドごとの常設接続を返し、ブロック終了時に commit（例外時は rollback）する。
+
+        Args:
+            write: True なら BEGIN IMMEDIATE で書込みロックを先に取る。
+                読んでから書く処理で、読取りロックからの昇格が他の書込みと
+                競合して SQLITE_BUSY になるのを防ぐ
+        """
+        conn = self._thread_connection()
+        if write and not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
         try:
             yield conn
             conn.commit()
         except Exception:
             conn.rollback()
             raise
-        finally:
-            conn.close()
 
     def _init_database(self):
         """データベーステーブルを初期化（マイグレーション含む）"""
         with self._get_connection() as conn:
+            # journal_mode はDBファイルに永続化されるので初期化時に1回だけ設定
+            conn.execute("PRAGMA journal_mode = WAL")
+
             cursor = conn.cursor()
 
             # 新3テーブルを作成
@@ -56,6 +318,9 @@ class MonthlyItemsDB:
                 )
             """)
 
+            # 正規化会社名カラム（_find_invoice_id のインデックス検索用）
+            self._ensure_normalized_name_column(cursor, "monthly_invoices")
+
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS delivery_notes (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -96,18 +361,8 @@ class MonthlyItemsDB:
             """)
 
             # インデックス作成
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_monthly_invoices_ym_company
-                ON monthly_invoices(year_month, company_name)
-            """)
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_delivery_notes_invoice_id
-                ON delivery_notes(monthly_invoice_id)
-            """)
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_delivery_items_note_id
-                ON delivery_items(delivery_note_id)
-            """)
+            for create_sql in _SECONDARY_INDEXES.values():
+                cursor.execute(create_sql)
             # slip_number ユニークインデックス（同一invoice内で重複防止）
             # 既存の重複データを先にクリーンアップしてからインデックスを作成
             try:
@@ -175,10 +430,17 @@ class MonthlyItemsDB:
                 )
             """)
 
+            # 正規化会社名カラム（_find_purchase_invoice_id のインデックス検索用）
+            self._ensure_normalized_name_column(cursor, "purchase_invoices")
+
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_purchase_invoices_ym_company
                 ON purchase_invoices(year_month, company_name)
             """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_purchase_invoices_ym_norm
+                ON purchase_invoices(year_month, normalized_company_name)
+            """)
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_purchase_notes_invoice_id
                 ON purchase_notes(purchase_invoice_id)
@@ -282,34 +544,65 @@ class MonthlyItemsDB:
             if cursor.fetchone():
                 self._migrate_from_old_table(cursor)
 
+    @staticmethod
+    def _ensure_normalized_name_column(cursor, table: str):
+        """normalized_company_name カラムが無ければ追加して既存行を埋める"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if any(row["name"] == "normalized_company_name" for row in cursor.fetchall()):
+            return
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN normalized_company_name TEXT")
+        cursor.execute(f"SELECT id, company_name FROM {table}")
+        cursor.executemany(
+            f"UPDATE {table} SET normalized_company_name = ? WHERE id = ?",
+            [
+                (normalize_company_name(row["company_name"]), row["id"])
+                for row in cursor.fetchall()
+            ],
+        )
+
     def _migrate_from_old_table(self, cursor):
         """旧 monthly_items テーブルからデータを移行"""
         print("旧テーブルからのマイグレーションを開始...")
-        cursor.execute("SELECT * FROM monthly_items")
-        old_rows = cursor.fetchall()
+
+        # 一括挿入中のインデックス更新を避けるため、非ユニークインデックスは
+        # 挿入後にまとめて作り直す（ユニーク制約は重複防止に必要なので残す）
+        for index_name in _SECONDARY_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+
+        # 旧行は items_json が大きいので全件 fetchall せず、別カーソルで1行ずつ読む
+        old_cursor = cursor.connection.cursor()
+        old_cursor.execute("SELECT * FROM monthly_items")
+        # 伝票・明細の INSERT はそれぞれ専用カーソルで実行する
+        note_cursor = cursor.connection.cursor()
+        item_cursor = cursor.connection.cursor()
+        migrated_count = 0
         current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+        item_rows: list[tuple] = []
 
-        for old_row in old_rows:
+        for old_row in old_cursor:
+            migrated_count += 1
             year_month = old_row["year_month"]
             company_name = old_row["company_name"]
             sales_person = old_row["sales_person"] or ""
 
-            # monthly_invoices に挿入
-            cursor.execute("""
-                INSERT OR IGNORE INTO monthly_invoices
-                (year_month, company_name, created_at, updated_at)
-                VALUES (?, ?, ?, ?)
-            """, (year_month, company_name, old_row["created_at"], old_row["updated_at"]))
+            # monthly_invoices に挿入（既存行はそのまま）し、id を RETURNING で受け取る
             cursor.execute("""
-                SELECT id FROM monthly_invoices
-                WHERE year_month = ? AND company_name = ?
-            """, (year_month, company_name))
+                INSERT INTO monthly_invoices
+                (year_month, company_name, normalized_company_name, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(year_month, company_name)
+                DO UPDATE SET updated_at = monthly_invoices.updated_at
+                RETURNING id
+            """, (
+                year_month, company_name, normalize_company_name(company_name),
+                old_row["created_at"], old_row["updated_at"],
+            ))
             invoice_id = cursor.fetchone()["id"]
 
             # items_json をパース
             try:
-                items_list = json.loads(old_row["items_json"])
-            except (json.JSONDecodeError, TypeError):
+                items_list = orjson.loads(old_row["items_json"])
+            except (orjson.JSONDecodeError, TypeError):
                 items_list = []
 
             for item_data in items_list:
@@ -323,7 +616,7 @@ class MonthlyItemsDB:
                 total = subtotal + tax
 
                 # delivery_notes に挿入
-                cursor.execute("""
+                note_cursor.execute("""
                     INSERT INTO delivery_notes
                     (monthly_invoice_id, slip_number, date, sales_person,
                      subtotal, tax, total, created_at, updated_at)
@@ -332,27 +625,89 @@ class MonthlyItemsDB:
                     invoice_id, slip_number, date, sales_person,
                     subtotal, tax, total, current_time, current_time,
                 ))
-                note_id = cursor.lastrowid
+                note_id = note_cursor.lastrowid
 
-                # delivery_items に挿入
-                for item in items:
-                    cursor.execute("""
-                        INSERT INTO delivery_items
-                        (delivery_note_id, product_code, product_name,
-                         quantity, unit_price, amount)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (
+                # delivery_items はある程度まとめて executemany で挿入
+                item_rows.extend(
+                    (
                         note_id,
                         item.get("product_code", ""),
                         item.get("product_name", ""),
                         item.get("quantity", 0),
                         item.get("unit_price", 0),
                         item.get("amount", 0),
-                    ))
+                    )
+                    for item in items
+                )
+            if len(item_rows) >= _MIGRATION_ITEM_BATCH_SIZE:
+                item_cursor.executemany(_SQL_INSERT_ITEM, item_rows)
+                item_rows.clear()
+
+        item_cursor.executemany(_SQL_INSERT_ITEM, item_rows)
+        for create_sql in _SECONDARY_INDEXES.values():
+            cursor.execute(create_sql)
 
         # 旧テーブルを削除
         cursor.execute("DROP TABLE monthly_items")
-        print(f"マイグレーション完了: {len(old_rows)}件のレコードを移行")
+        print(f"マイグレーション完了: {migrated_count}件のレコードを移行")
+
+    @staticmethod
+    def _upsert_delivery_note(
+        cursor,
+        invoice_id: int,
+        delivery_note: DeliveryNote,
+        sales_person: str,
+        current_time: str,
+    ) -> sqlite3.Row:
+        """delivery_notes を (monthly_invoice_id, slip_number) でUPSERT
+
+        Returns:
+            UPSERT した行の (id, created_at)。created_at が current_time と
+            異なれば既存伝票の上書き
+        """
+        cursor.execute(_SQL_UPSERT_NOTE, (
+            invoice_id,
+            delivery_note.slip_number or "",
+            delivery_note.date or "",
+            sales_person,
+            delivery_note.subtotal,
+            delivery_note.tax,
+            delivery_note.total,
+            current_time,
+            current_time,
+        ))
+        return cursor.fetchone()
+
+    @staticmethod
+    def _diff_note_items(cursor, note_id: int, items: list[DeliveryItem]) -> list[tuple]:
+        """伝票の既存明細を新しい明細に合わせて差分更新し、追加が必要な行を返す
+
+        既存行と新しい明細を先頭から位置ごとに比較し、変わった行だけ UPDATE、
+        余った既存行は DELETE する（明細の並び順は id 順のまま保たれる）。
+        新しい明細の方が多い場合の残りは、呼び出し側でまとめて INSERT する。
+
+        Returns:
+            _SQL_INSERT_ITEM 用の行タプルのリスト
+        """
+        new_rows = [
+            (code or "", name, quantity, unit_price, amount)
+            for code, name, quantity, unit_price, amount in map(_ITEM_FIELDS, items)
+        ]
+        cursor.execute(_SQL_SELECT_NOTE_ITEMS, (note_id,))
+        existing = cursor.fetchall()
+
+        updates = [
+            (*new_row, old["id"])
+            for old, new_row in zip(existing, new_rows)
+            if tuple(old)[1:] != new_row
+        ]
+        if updates:
+            cursor.executemany(_SQL_UPDATE_ITEM, updates)
+        if len(existing) > len(new_rows):
+            cursor.executemany(
+                _SQL_DELETE_ITEM, [(old["id"],) for old in existing[len(new_rows):]],
+            )
+        return [(note_id, *new_row) for new_row in new_rows[len(existing):]]
 
     def _find_invoice_id(
         self, cursor, year_month: str, company_name: str,
@@ -363,19 +718,26 @@ class MonthlyItemsDB:
             (id, company_name) tuple、見つからない場合は None
         """
         # まず完全一致を試みる
-        cursor.execute("""
-            SELECT id, company_name FROM monthly_invoices
-            WHERE year_month = ? AND company_name = ?
-        """, (year_month, company_name))
+        cursor.execute(_SQL_FIND_INVOICE_EXACT, (year_month, company_name))
         row = cursor.fetchone()
         if row:
             return (row["id"], row["company_name"])
 
-        # 完全一致がなければ、match_company_name で最適マッチ
-        cursor.execute("""
-            SELECT id, company_name FROM monthly_invoices
-            WHERE year_month = ?
-        """, (year_month,))
+        # 正規化名の完全一致はインデックスで引く（同名が複数なら曖昧として None）
+        normalized = normalize_company_name(company_name)
+        if not normalized:
+            return None
+        cursor.execute(_SQL_FIND_INVOICE_NORMALIZED, (year_month, normalized))
+        rows = cursor.fetchall()
+        if len(rows) == 1:
+            row = rows[0]
+            print(f"    正規化マッチ: '{company_name}' → DB内 '{row['company_name']}'")
+            return (row["id"], row["company_name"])
+        if rows:
+            return None
+
+        # 正規化一致もなければ、match_company_name で部分一致を探す
+        cursor.execute(_SQL_SELECT_INVOICES_IN_MONTH, (year_month,))
         rows = cursor.fetchall()
 
         if not rows:
@@ -433,12 +795,17 @@ class MonthlyItemsDB:
                     "sales_person": row["sales_person"],
                     "saved_at": row["updated_at"],
                 }
-                for row in cursor.fetchall()
+                for row in cursor
             ]
 
     def check_request_id(self, request_id: str) -> bool:
         """冪等性トークンが既に処理済みかチェック
 
+        保存前の早期リターン用（重複伝票チェックより先に「処理済み」を返すため）。
+        save_monthly_items_batch / save_purchase_batch は書込みロックを取った
+        トランザクション内で再チェックして記録するので、判定の正はそちら。
+        スレッドごとの既存接続を使うので、接続の確立は発生しない。
+
         Returns:
             True: 既に処理済み（スキップすべき）
             False: 未処理（実行すべき）
@@ -446,12 +813,24 @@ class MonthlyItemsDB:
         if not request_id:
             return False
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT 1 FROM save_requests WHERE request_id = ?",
-                (request_id,),
-            )
-            return cursor.fetchone() is not None
+            return self._request_id_exists(conn, request_id)
+
+    @staticmethod
+    def _tuple_cursor(conn: sqlite3.Connection) -> sqlite3.Cursor:
+        """行をタプルで返すカーソルを作成（接続の row_factory = sqlite3.Row を外す）
+
+        件数の多い取得は列名アクセスが不要なので、Row の生成を省いて位置で展開する。
+        """
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        return cursor
+
+    @classmethod
+    def _request_id_exists(cls, conn: sqlite3.Connection, request_id: str) -> bool:
+        """save_requests に request_id が記録済みかを EXISTS で判定（0/1 のスカラー）"""
+        cursor = cls._tuple_cursor(conn)
+        cursor.execute(_SQL_CHECK_REQUEST_ID, (request_id,))
+        return cursor.fetchone()[0] == 1
 
     def record_request_id(self, request_id: str, cursor=None):
         """冪等性トークンを記録"""
@@ -460,13 +839,13 @@ class MonthlyItemsDB:
         current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
         if cursor:
             cursor.execute(
-                "INSERT OR IGNORE INTO save_requests (request_id, created_at) VALUES (?, ?)",
+                _SQL_RECORD_REQUEST_ID,
                 (request_id, current_time),
             )
         else:
             with self._get_connection() as conn:
                 conn.cursor().execute(
-                    "INSERT OR IGNORE INTO save_requests (request_id, created_at) VALUES (?, ?)",
+                    _SQL_RECORD_REQUEST_ID,
                     (request_id, current_time),
                 )
 
@@ -482,10 +861,10 @@ class MonthlyItemsDB:
         monthly_invoices をUPSERT → delivery_notes をUPSERT（slip_number重複時はUPDATE）
         → delivery_items を再作成
         """
-        sales_person_clean = "".join(sales_person.split())
+        sales_person_clean = sales_person.translate(_WS_TABLE)
         current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
 
-        with self._get_connection() as conn:
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
 
             # monthly_invoices を検索または作成
@@ -495,88 +874,35 @@ class MonthlyItemsDB:
                 invoice_id, db_company_name = result
                 # 会社名がシート正規名と異なる場合は更新
                 if db_company_name != company_name:
-                    cursor.execute("""
-                        UPDATE monthly_invoices SET company_name = ?, updated_at = ? WHERE id = ?
-                    """, (company_name, current_time, invoice_id))
+                    cursor.execute(_SQL_RENAME_INVOICE, (
+                        company_name, normalize_company_name(company_name), current_time, invoice_id,
+                    ))
                     print(f"    月次明細DB会社名更新: '{db_company_name}' → '{company_name}' (ID {invoice_id})")
                 else:
-                    cursor.execute("""
-                        UPDATE monthly_invoices SET updated_at = ? WHERE id = ?
-                    """, (current_time, invoice_id))
+                    cursor.execute(_SQL_TOUCH_INVOICE, (current_time, invoice_id))
                 print(f"    月次明細DB更新: {company_name} ({year_month}) - ID {invoice_id}")
             else:
-                cursor.execute("""
-                    INSERT INTO monthly_invoices
-                    (year_month, company_name, created_at, updated_at)
-                    VALUES (?, ?, ?, ?)
-                """, (year_month, company_name, current_time, current_time))
+                cursor.execute(_SQL_INSERT_INVOICE, (
+                    year_month, company_name, normalize_company_name(company_name),
+                    current_time, current_time,
+                ))
                 invoice_id = cursor.lastrowid
                 print(f"    月次明細DB新規作成: {company_name} ({year_month})")
 
             # delivery_notes をUPSERT（slip_number重複時はUPDATE）
             slip = delivery_note.slip_number or ""
-            cursor.execute("""
-                SELECT id FROM delivery_notes
-                WHERE monthly_invoice_id = ? AND slip_number = ?
-            """, (invoice_id, slip))
-            existing_note = cursor.fetchone()
-
-            if existing_note:
-                note_id = existing_note["id"]
-                cursor.execute("""
-                    UPDATE delivery_notes
-                    SET date = ?, sales_person = ?,
-                        subtotal = ?, tax = ?, total = ?, updated_at = ?
-                    WHERE id = ?
-                """, (
-                    delivery_note.date or "",
-                    sales_person_clean,
-                    delivery_note.subtotal,
-                    delivery_note.tax,
-                    delivery_note.total,
-                    current_time,
-                    note_id,
-                ))
-                # 既存items削除して再作成
-                cursor.execute(
-                    "DELETE FROM delivery_items WHERE delivery_note_id = ?",
-                    (note_id,),
-                )
+            note_row = self._upsert_delivery_note(
+                cursor, invoice_id, delivery_note, sales_person_clean, current_time,
+            )
+            note_id = note_row["id"]
+            if note_row["created_at"] != current_time:
                 print(f"    月次明細DB: slip_number '{slip}' を上書き更新")
-            else:
-                cursor.execute("""
-                    INSERT INTO delivery_notes
-                    (monthly_invoice_id, slip_number, date, sales_person,
-                     subtotal, tax, total, created_at, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    invoice_id,
-                    slip,
-                    delivery_note.date or "",
-                    sales_person_clean,
-                    delivery_note.subtotal,
-                    delivery_note.tax,
-                    delivery_note.total,
-                    current_time,
-                    current_time,
-                ))
-                note_id = cursor.lastrowid
 
-            # delivery_items に挿入
-            for item in delivery_note.items:
-                cursor.execute("""
-                    INSERT INTO delivery_items
-                    (delivery_note_id, product_code, product_name,
-                     quantity, unit_price, amount)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    note_id,
-                    item.product_code or "",
-                    item.product_name,
-                    item.quantity,
-                    item.unit_price,
-                    item.amount,
-                ))
+            # delivery_items は変わった行だけ更新し、増えた分を一括挿入
+            cursor.executemany(
+                _SQL_INSERT_ITEM,
+                self._diff_note_items(cursor, note_id, delivery_note.items),
+            )
 
     def save_monthly_items_batch(
         self,
@@ -590,21 +916,16 @@ class MonthlyItemsDB:
 
         全件成功するか全件ロールバック。冪等性トークンも同一トランザクション内で記録。
         """
-        sales_person_clean = "".join(sales_person.split())
+        sales_person_clean = sales_person.translate(_WS_TABLE)
         current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
 
-        with self._get_connection() as conn:
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
 
             # 冪等性チェック（トランザクション内で再チェック）
-            if request_id:
-                cursor.execute(
-                    "SELECT 1 FROM save_requests WHERE request_id = ?",
-                    (request_id,),
-                )
-                if cursor.fetchone():
-                    print(f"    冪等性トークン '{request_id}' は処理済み。スキップ。")
-                    return 0
+            if request_id and self._request_id_exists(conn, request_id):
+                print(f"    冪等性トークン '{request_id}' は処理済み。スキップ。")
+                return 0
 
             # monthly_invoices を検索または作成
             result = self._find_invoice_id(cursor, year_month, company_name)
@@ -612,87 +933,41 @@ class MonthlyItemsDB:
             if result:
                 invoice_id, db_company_name = result
                 if db_company_name != company_name:
-                    cursor.execute("""
-                        UPDATE monthly_invoices SET company_name = ?, updated_at = ? WHERE id = ?
-                    """, (company_name, current_time, invoice_id))
+                    cursor.execute(_SQL_RENAME_INVOICE, (
+                        company_name, normalize_company_name(company_name), current_time, invoice_id,
+                    ))
                 else:
-                    cursor.execute("""
-                        UPDATE monthly_invoices SET updated_at = ? WHERE id = ?
-                    """, (current_time, invoice_id))
+                    cursor.execute(_SQL_TOUCH_INVOICE, (current_time, invoice_id))
             else:
-                cursor.execute("""
-                    INSERT INTO monthly_invoices
-                    (year_month, company_name, created_at, updated_at)
-                    VALUES (?, ?, ?, ?)
-                """, (year_month, company_name, current_time, current_time))
+                cursor.execute(_SQL_INSERT_INVOICE, (
+                    year_month, company_name, normalize_company_name(company_name),
+                    current_time, current_time,
+                ))
                 invoice_id = cursor.lastrowid
 
             saved_count = 0
+            items_by_note: dict[int, list[tuple]] = {}
             for delivery_note in delivery_notes:
-                slip = delivery_note.slip_number or ""
-                cursor.execute("""
-                    SELECT id FROM delivery_notes
-                    WHERE monthly_invoice_id = ? AND slip_number = ?
-                """, (invoice_id, slip))
-                existing_note = cursor.fetchone()
-
-                if existing_note:
-                    note_id = existing_note["id"]
-                    cursor.execute("""
-                        UPDATE delivery_notes
-                        SET date = ?, sales_person = ?,
-                            subtotal = ?, tax = ?, total = ?, updated_at = ?
-                        WHERE id = ?
-                    """, (
-                        delivery_note.date or "",
-                        sales_person_clean,
-                        delivery_note.subtotal,
-                        delivery_note.tax,
-                        delivery_note.total,
-                        current_time,
-                        note_id,
-                    ))
-                    cursor.execute(
-                        "DELETE FROM delivery_items WHERE delivery_note_id = ?",
-                        (note_id,),
-                    )
-                else:
-                    cursor.execute("""
-                        INSERT INTO delivery_notes
-                        (monthly_invoice_id, slip_number, date, sales_person,
-                         subtotal, tax, total, created_at, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        invoice_id, slip,
-                        delivery_note.date or "",
-                        sales_person_clean,
-                        delivery_note.subtotal,
-                        delivery_note.tax,
-                        delivery_note.total,
-                        current_time, current_time,
-                    ))
-                    note_id = cursor.lastrowid
-
-                for item in delivery_note.items:
-                    cursor.execute("""
-                        INSERT INTO delivery_items
-                        (delivery_note_id, product_code, product_name,
-                         quantity, unit_price, amount)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (
-                        note_id,
-                        item.product_code or "",
-                        item.product_name,
-                        item.quantity,
-                        item.unit_price,
-                        item.amount,
-                    ))
+                note_id = self._upsert_delivery_note(
+                    cursor, invoice_id, delivery_note, sales_person_clean, current_time,
+                )["id"]
+
+                # 既存明細は差分更新し、追加分だけ集めて最後に executemany で一括INSERT
+                # （同一伝票番号が重複した場合は後の差分で上書きされ、後勝ちになる）
+                items_by_note[note_id] = self._diff_note_items(
+                    cursor, note_id, delivery_note.items,
+                )
                 saved_count += 1
 
+            cursor.executemany(
+                _SQL_INSERT_ITEM,
+                [row for rows in items_by_note.values() for row in rows],
+            )
+
             # 冪等性トークンを記録（同一トランザクション内）
             if request_id:
                 cursor.execute(
-                    "INSERT OR IGNORE INTO save_requests (request_id, created_at) VALUES (?, ?)",
+                    _SQL_RECORD_REQUEST_ID,
                     (request_id, current_time),
                 )
 
@@ -705,7 +980,7 @@ class MonthlyItemsDB:
         year_month: str,
     ):
         """指定した会社・年月の月次明細レコードを削除（CASCADE削除）"""
-        with self._get_connection() as conn:
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
             result = self._find_invoice_id(cursor, year_month, company_name)
             if result:
@@ -726,74 +1001,100 @@ class MonthlyItemsDB:
 
         3テーブルJOINで取得し、DeliveryNote のリストとして返す。
         sales_person が指定された場合、その担当者の納品書のみ返す。
+
+        同じ条件の再取得では、DBに変更が無ければ前回の取得行を再利用する
+        （会社名の照合とJOINを省略）。DeliveryNote は毎回新しく組み立てる。
         """
         with self._get_connection() as conn:
             cursor = conn.cursor()
+            note_rows = self._cached_read(
+                conn,
+                ("monthly_items", company_name, year_month, sales_person),
+                lambda: self._select_monthly_item_rows(
+                    cursor, company_name, year_month, sales_person,
+                ),
+            )
 
-            result = self._find_invoice_id(cursor, year_month, company_name)
-            if not result:
+            if note_rows is None:
                 print(f"    月次明細DB: レコードが見つかりません ({company_name}, {year_month})")
                 return []
 
-            invoice_id, _ = result
-
-            # delivery_notes を取得（担当者フィルター対応）
-            if sales_person:
-                cursor.execute("""
-                    SELECT id, slip_number, date, sales_person,
-                           subtotal, tax, total
-                    FROM delivery_notes
-                    WHERE monthly_invoice_id = ? AND sales_person = ?
-                    ORDER BY id
-                """, (invoice_id, sales_person))
-            else:
-                cursor.execute("""
-                    SELECT id, slip_number, date, sales_person,
-                           subtotal, tax, total
-                    FROM delivery_notes
-                    WHERE monthly_invoice_id = ?
-                    ORDER BY id
-                """, (invoice_id,))
-            note_rows = cursor.fetchall()
-
             delivery_notes = []
-            for note_row in note_rows:
-                # delivery_items を取得
-                cursor.execute("""
-                    SELECT product_code, product_name, quantity,
-                           unit_price, amount
-                    FROM delivery_items
-                    WHERE delivery_note_id = ?
-                    ORDER BY id
-                """, (note_row["id"],))
-                item_rows = cursor.fetchall()
-
+            for _, rows in groupby(note_rows, key=itemgetter(0)):
+                rows = list(rows)
+                _, slip_number, date, subtotal, tax, total = rows[0][:6]
                 items = [
                     DeliveryItem(
-                        slip_number=note_row["slip_number"],
-                        product_code=row["product_code"],
-                        product_name=row["product_name"],
-                        quantity=row["quantity"],
-                        unit_price=row["unit_price"],
-                        amount=row["amount"],
+                        slip_number=slip_number,
+                        product_code=product_code,
+                        product_name=product_name,
+                        quantity=quantity,
+                        unit_price=unit_price,
+                        amount=amount,
                     )
-                    for row in item_rows
+                    for (*_, item_id, product_code, product_name,
+                         quantity, unit_price, amount) in rows
+                    if item_id is not None
                 ]
 
                 dn = DeliveryNote(
-                    slip_number=note_row["slip_number"],
-                    date=note_row["date"],
+                    slip_number=slip_number,
+                    date=date,
                     company_name=company_name,
                     items=items,
-                    subtotal=note_row["subtotal"],
-                    tax=note_row["tax"],
-                    total=note_row["total"],
+                    subtotal=subtotal,
+                    tax=tax,
+                    total=total,
                 )
                 delivery_notes.append(dn)
 
             print(f"    月次明細DB取得: {company_name} ({year_month}) - {len(delivery_notes)}件の納品書")
             return delivery_notes
 
+    def _cached_read(self, conn: sqlite3.Connection, key: tuple, load):
+        """スレッドごとの読み取り結果キャッシュを通して load() の結果を返す
+
+        DBに変更が無ければ前回の結果を再利用する。キャッシュした値は共有されるので、
+        呼び出し側で変更しないこと（リストを返す場合はコピーして渡す）。
+        """
+        # data_version は他接続・他プロセスのコミットで、total_changes は
+        # この接続自身の書き込みで変わる → どちらかが変われば再取得
+        token = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        read_cache: dict = self._local.read_cache
+        cached = read_cache.pop(key, None)
+        if cached is not None and cached[0] == token:
+            value = cached[1]
+        else:
+            value = load()
+        read_cache[key] = (token, value)
+        if len(read_cache) > _READ_CACHE_MAXSIZE:
+            del read_cache[next(iter(read_cache))]
+        return value
+
+    def _select_monthly_item_rows(
+        self, cursor, company_name: str, year_month: str, sales_person: str,
+    ) -> Optional[list[tuple]]:
+        """get_monthly_items 用に伝票・明細の JOIN 行をタプルで取得（請求が無ければ None）
+
+        列順は _SQL_SELECT_NOTES_WITH_ITEMS の SELECT 句の通り。
+        """
+        result = self._find_invoice_id(cursor, year_month, company_name)
+        if not result:
+            return None
+
+        invoice_id, _ = result
+
+        # delivery_notes と delivery_items を1回の JOIN で取得（担当者フィルター対応）
+        # 明細の無い伝票も残すため LEFT JOIN
+        rows_cursor = self._tuple_cursor(cursor.connection)
+        if sales_person:
+            rows_cursor.execute(
+                _SQL_SELECT_NOTES_WITH_ITEMS_BY_PERSON, (invoice_id, sales_person),
+            )
+        else:
+            rows_cursor.execute(_SQL_SELECT_NOTES_WITH_ITEMS_ALL, (invoice_id,))
+        return rows_cursor.fetchall()
+
     def update_monthly_item(
         self,
         company_name: str,
@@ -803,13 +1104,12 @@ class MonthlyItemsDB:
     ):
         """月次明細DBの特定の納品書データを更新
 
-        slip_numberでdelivery_notesを特定し、UPDATE + delivery_items再作成。
-        差分計算が不要（単純なUPDATE/DELETE+INSERT）。
+        slip_numberでdelivery_notesを特定し、UPDATE + delivery_items を差分更新。
         """
-        sales_person_clean = "".join(sales_person.split())
+        sales_person_clean = sales_person.translate(_WS_TABLE)
         current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
 
-        with self._get_connection() as conn:
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
 
             result = self._find_invoice_id(cursor, year_month, company_name)
@@ -853,12 +1153,6 @@ class MonthlyItemsDB:
                     current_time,
                     note_id,
                 ))
-
-                # delivery_items を全削除して再挿入
-                cursor.execute(
-                    "DELETE FROM delivery_items WHERE delivery_note_id = ?",
-                    (note_id,),
-                )
                 print(f"    月次明細DB: slip_number '{delivery_note.slip_number}' を更新")
             else:
                 # slip_number が見つからない場合は新規追加
@@ -881,26 +1175,14 @@ class MonthlyItemsDB:
                 note_id = cursor.lastrowid
                 print(f"    月次明細DB: slip_number '{delivery_note.slip_number}' が見つかりません、追加しました")
 
-            # delivery_items を挿入
-            for item in delivery_note.items:
-                cursor.execute("""
-                    INSERT INTO delivery_items
-                    (delivery_note_id, product_code, product_name,
-                     quantity, unit_price, amount)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    note_id,
-                    item.product_code or "",
-                    item.product_name,
-                    item.quantity,
-                    item.unit_price,
-                    item.amount,
-                ))
+            # delivery_items は変わった行だけ更新し、増えた分を一括挿入
+            cursor.executemany(
+                _SQL_INSERT_ITEM,
+                self._diff_note_items(cursor, note_id, delivery_note.items),
+            )
 
             # monthly_invoices の updated_at を更新
-            cursor.execute("""
-                UPDATE monthly_invoices SET updated_at = ? WHERE id = ?
-            """, (current_time, invoice_id))
+            cursor.execute(_SQL_TOUCH_INVOICE, (current_time, invoice_id))
 
             print(f"    月次明細DB更新完了: {company_name} ({year_month})")
 
@@ -912,7 +1194,7 @@ class MonthlyItemsDB:
                           nontaxable_subtotal, nontaxable_tax}, ...]
         """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
+            cursor = self._tuple_cursor(conn)
             cursor.execute("""
                 SELECT pi.company_name, pi.year_month,
                        COALESCE(SUM(CASE WHEN pn.is_taxable = 1 THEN pn.subtotal ELSE 0 END), 0) AS taxable_subtotal,
@@ -926,14 +1208,15 @@ class MonthlyItemsDB:
             """)
             return [
                 {
-                    "company_name": row["company_name"],
-                    "year_month": row["year_month"],
-                    "taxable_subtotal": row["taxable_subtotal"] or 0,
-                    "taxable_tax": row["taxable_tax"] or 0,
-                    "nontaxable_subtotal": row["nontaxable_subtotal"] or 0,
-                    "nontaxable_tax": row["nontaxable_tax"] or 0,
+                    "company_name": company,
+                    "year_month": ym,
+                    "taxable_subtotal": taxable_subtotal or 0,
+                    "taxable_tax": taxable_tax or 0,
+                    "nontaxable_subtotal": nontaxable_subtotal or 0,
+                    "nontaxable_tax": nontaxable_tax or 0,
                 }
-                for row in cursor.fetchall()
+                for (company, ym, taxable_subtotal, taxable_tax,
+                     nontaxable_subtotal, nontaxable_tax) in cursor
             ]
 
     def get_all_monthly_totals(self) -> list[dict]:
@@ -943,7 +1226,7 @@ class MonthlyItemsDB:
             list[dict]: [{company_name, year_month, subtotal, tax}, ...]
         """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
+            cursor = self._tuple_cursor(conn)
             cursor.execute("""
                 SELECT mi.company_name, mi.year_month,
                        SUM(dn.subtotal) as total_subtotal,
@@ -955,12 +1238,12 @@ class MonthlyItemsDB:
             """)
             return [
                 {
-                    "company_name": row["company_name"],
-                    "year_month": row["year_month"],
-                    "subtotal": row["total_subtotal"],
-                    "tax": row["total_tax"],
+                    "company_name": company,
+                    "year_month": ym,
+                    "subtotal": subtotal,
+                    "tax": tax,
                 }
-                for row in cursor.fetchall()
+                for company, ym, subtotal, tax in cursor
             ]
 
     def get_distinct_year_months(self) -> list[str]:
@@ -976,7 +1259,7 @@ class MonthlyItemsDB:
                 FROM monthly_invoices
                 ORDER BY year_month
             """)
-            return [row["year_month"] for row in cursor.fetchall()]
+            return [row["year_month"] for row in cursor]
 
     # ===== 得意先/仕入先マスタ (company_master) =====
 
@@ -1033,7 +1316,7 @@ class MonthlyItemsDB:
                 """,
                 (domain,),
             )
-            return [row["canonical_name"] for row in cursor.fetchall()]
+            return [row["canonical_name"] for row in cursor]
 
     def list_companies(self, domain: str, include_inactive: bool = False) -> list[dict]:
         """マスタ全件を返す（管理画面用）"""
@@ -1045,7 +1328,7 @@ class MonthlyItemsDB:
                 sql += " AND is_active = 1"
             sql += " ORDER BY id"
             cursor.execute(sql, params)
-            return [self._company_row_to_dict(row) for row in cursor.fetchall()]
+            return [self._company_row_to_dict(row) for row in cursor]
 
     def get_company(self, domain: str, canonical_name: str) -> Optional[dict]:
         """domain + canonical_name で1件取得（is_active 問わず）"""
@@ -1091,7 +1374,7 @@ class MonthlyItemsDB:
 
         current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
         taxable_val = None if taxable is None else (1 if taxable else 0)
-        with self._get_connection() as conn:
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -1132,7 +1415,7 @@ class MonthlyItemsDB:
         new_active = existing["is_active"] if is_active is None else (1 if is_active else 0)
 
         current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-        with self._get_connection() as conn:
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -1184,7 +1467,7 @@ class MonthlyItemsDB:
             total: 合計
         """
         current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-        with self._get_connection() as conn:
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 UPDATE delivery_notes
@@ -1194,7 +1477,7 @@ class MonthlyItemsDB:
 
     def get_delivery_notes_with_ids(
         self, company_name: str, year_month: str
-    ) -> list[dict]:
+    ) -> list[DeliveryNoteRow]:
         """指定した会社・年月の納品書一覧をID付きで返す（編集画面用）
 
         Args:
@@ -1202,7 +1485,7 @@ class MonthlyItemsDB:
             year_month: 年月（例: "2025年1月"）
 
         Returns:
-            list[dict]: [{id, slip_number, date, subtotal, tax, total}, ...]
+            list[DeliveryNoteRow]: (id, slip_number, date, subtotal, tax, total) の行
         """
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -1211,59 +1494,63 @@ class MonthlyItemsDB:
                 return []
 
             invoice_id, _ = result
+            cursor = self._tuple_cursor(conn)
             cursor.execute("""
                 SELECT id, slip_number, date, subtotal, tax, total
                 FROM delivery_notes
                 WHERE monthly_invoice_id = ?
                 ORDER BY id
             """, (invoice_id,))
-            return [
-                {
-                    "id": row["id"],
-                    "slip_number": row["slip_number"],
-                    "date": row["date"],
-                    "subtotal": row["subtotal"],
-                    "tax": row["tax"],
-                    "total": row["total"],
-                }
-                for row in cursor.fetchall()
-            ]
+            return list(map(DeliveryNoteRow._make, cursor))
 
     def get_distinct_companies(self) -> list[str]:
-        """月次明細DBに保存されているすべての会社名を取得"""
+        """月次明細DBに保存されているすべての会社名を取得
+
+        DBに変更が無い間は前回の結果を再利用する（_cached_read）。
+        """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT DISTINCT company_name
-                FROM monthly_invoices
-                ORDER BY company_name
-            """)
-            return [row["company_name"] for row in cursor.fetchall()]
+            def load() -> list[str]:
+                cursor = self._tuple_cursor(conn)
+                cursor.execute("""
+                    SELECT DISTINCT company_name
+                    FROM monthly_invoices
+                    ORDER BY company_name
+                """)
+                return [company for company, in cursor]
+
+            return list(self._cached_read(conn, ("distinct_companies",), load))
 
     def get_distinct_sales_persons(self, company_name: str = "") -> list[str]:
         """月次明細DBに保存されている担当者名を取得
 
+        DBに変更が無い間は前回の結果を再利用する（_cached_read）。
+
         Args:
             company_name: 指定すると、その会社に紐づく担当者のみ返す
         """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            if company_name:
-                cursor.execute("""
-                    SELECT DISTINCT dn.sales_person
-                    FROM delivery_notes dn
-                    JOIN monthly_invoices mi ON mi.id = dn.monthly_invoice_id
-                    WHERE dn.sales_person != '' AND mi.company_name = ?
-                    ORDER BY dn.sales_person
-                """, (company_name,))
-            else:
-                cursor.execute("""
-                    SELECT DISTINCT sales_person
-                    FROM delivery_notes
-                    WHERE sales_person != ''
-                    ORDER BY sales_person
-                """)
-            return [row["sales_person"] for row in cursor.fetchall()]
+            def load() -> list[str]:
+                cursor = self._tuple_cursor(conn)
+                if company_name:
+                    cursor.execute("""
+                        SELECT DISTINCT dn.sales_person
+                        FROM delivery_notes dn
+                        JOIN monthly_invoices mi ON mi.id = dn.monthly_invoice_id
+                        WHERE dn.sales_person != '' AND mi.company_name = ?
+                        ORDER BY dn.sales_person
+                    """, (company_name,))
+                else:
+                    cursor.execute("""
+                        SELECT DISTINCT sales_person
+                        FROM delivery_notes
+                        WHERE sales_person != ''
+                        ORDER BY sales_person
+                    """)
+                return [sales_person for sales_person, in cursor]
+
+            return list(self._cached_read(
+                conn, ("distinct_sales_persons", company_name), load,
+            ))
 
     # ========================================
     # 仕入れ用メソッド
@@ -1285,6 +1572,20 @@ class MonthlyItemsDB:
         if row:
             return (row["id"], row["company_name"])
 
+        # 正規化名の完全一致はインデックスで引く（同名が複数なら曖昧として None）
+        normalized = normalize_company_name(company_name)
+        if not normalized:
+            return None
+        cursor.execute(_SQL_FIND_PURCHASE_INVOICE_NORMALIZED, (year_month, normalized))
+        rows = cursor.fetchall()
+        if len(rows) == 1:
+            row = rows[0]
+            print(f"    仕入れ正規化マッチ: '{company_name}' → DB内 '{row['company_name']}'")
+            return (row["id"], row["company_name"])
+        if rows:
+            return None
+
+        # 正規化一致もなければ、match_company_name で部分一致を探す
         cursor.execute("""
             SELECT id, company_name FROM purchase_invoices
             WHERE year_month = ?
@@ -1322,146 +1623,173 @@ class MonthlyItemsDB:
                 return []
 
             invoice_id, _ = result
-            placeholders = ",".join("?" for _ in slip_numbers)
-            cursor.execute(f"""
-                SELECT slip_number, date, subtotal, tax, total,
-                       sales_person, updated_at
-                FROM purchase_notes
-                WHERE purchase_invoice_id = ?
-                  AND slip_number IN ({placeholders})
-                ORDER BY slip_number
-            """, [invoice_id] + slip_numbers)
+            return self._select_existing_purchase_notes(cursor, invoice_id, slip_numbers)
 
-            return [
-                {
-                    "slip_number": row["slip_number"],
-                    "date": row["date"],
-                    "subtotal": row["subtotal"],
-                    "tax": row["tax"],
-                    "total": row["total"],
-                    "sales_person": row["sales_person"],
-                    "saved_at": row["updated_at"],
-                }
-                for row in cursor.fetchall()
-            ]
+    def _select_existing_purchase_notes(
+        self,
+        cursor: sqlite3.Cursor,
+        invoice_id: int,
+        slip_numbers: list[str],
+    ) -> list[dict]:
+        """purchase_invoice_id 配下で slip_numbers に該当する既存伝票を返す"""
+        if not slip_numbers:
+            return []
+
+        placeholders = ",".join("?" for _ in slip_numbers)
+        cursor.execute(f"""
+            SELECT slip_number, date, subtotal, tax, total,
+                   sales_person, updated_at
+            FROM purchase_notes
+            WHERE purchase_invoice_id = ?
+              AND slip_number IN ({placeholders})
+            ORDER BY slip_number
+        """, [invoice_id] + slip_numbers)
+
+        return [
+            {
+                "slip_number": row["slip_number"],
+                "date": row["date"],
+                "subtotal": row["subtotal"],
+                "tax": row["tax"],
+                "total": row["total"],
+                "sales_person": row["sales_person"],
+                "saved_at": row["updated_at"],
+            }
+            for row in cursor
+        ]
 
     def save_purchase_batch(
         self,
         company_name: str,
         year_month: str,
-        purchase_invoices: list[PurchaseInvoice],
+        purchase_invoices: Sequence[PurchaseInvoiceLike],
         sales_person: str = "",
         request_id: str = "",
     ):
-        """複数の仕入れ納品書を単一トランザクションでDB保存"""
-        sales_person_clean = "".join(sales_person.split())
+        """複数の仕入れ納品書を単一トランザクションでDB保存（既存伝票は上書き）
+
+        purchase_invoices は PurchaseInvoice でも API のリクエストモデルでもよい
+        （仕入先名は company_name を使うので supplier_name は参照しない）。
+        """
+        saved_count, _ = self._save_purchase_batch(
+            company_name, year_month, purchase_invoices,
+            sales_person=sales_person,
+            request_id=request_id,
+            skip_if_exists=False,
+        )
+        return saved_count
+
+    def save_purchase_batch_if_absent(
+        self,
+        company_name: str,
+        year_month: str,
+        purchase_invoices: Sequence[PurchaseInvoiceLike],
+        sales_person: str = "",
+        request_id: str = "",
+    ) -> tuple[int, list[dict]]:
+        """重複チェックと一括保存を単一トランザクションで行う
+
+        伝票番号が既にDBにあれば何も書き込まずに (0, 既存伝票のリスト) を返す。
+        重複が無ければ保存して (保存件数, []) を返す。
+        BEGIN IMMEDIATE で書込みロックを先に取るので、チェックと保存の間に
+        他リクエストが同じ伝票を保存することはない。
+        """
+        return self._save_purchase_batch(
+            company_name, year_month, purchase_invoices,
+            sales_person=sales_person,
+            request_id=request_id,
+            skip_if_exists=True,
+        )
+
+    def _save_purchase_batch(
+        self,
+        company_name: str,
+        year_month: str,
+        purchase_invoices: Sequence[PurchaseInvoiceLike],
+        sales_person: str,
+        request_id: str,
+        skip_if_exists: bool,
+    ) -> tuple[int, list[dict]]:
+        sales_person_clean = sales_person.translate(_WS_TABLE)
         current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
 
-        with self._get_connection() as conn:
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
 
-            if request_id:
-                cursor.execute(
-                    "SELECT 1 FROM save_requests WHERE request_id = ?",
-                    (request_id,),
-                )
-                if cursor.fetchone():
-                    print(f"    冪等性トークン '{request_id}' は処理済み。スキップ。")
-                    return 0
+            if request_id and self._request_id_exists(conn, request_id):
+                print(f"    冪等性トークン '{request_id}' は処理済み。スキップ。")
+                return 0, []
 
             result = self._find_purchase_invoice_id(cursor, year_month, company_name)
 
+            if result and skip_if_exists:
+                existing = self._select_existing_purchase_notes(
+                    cursor,
+                    result[0],
+                    [pi.slip_number for pi in purchase_invoices if pi.slip_number],
+                )
+                if existing:
+                    return 0, existing
+
             if result:
                 invoice_id, db_company_name = result
                 if db_company_name != company_name:
-                    cursor.execute("""
-                        UPDATE purchase_invoices SET company_name = ?, updated_at = ? WHERE id = ?
-                    """, (company_name, current_time, invoice_id))
+                    cursor.execute(_SQL_RENAME_PURCHASE_INVOICE, (
+                        company_name, normalize_company_name(company_name), current_time, invoice_id,
+                    ))
                 else:
-                    cursor.execute("""
-                        UPDATE purchase_invoices SET updated_at = ? WHERE id = ?
-                    """, (current_time, invoice_id))
+                    cursor.execute(_SQL_TOUCH_PURCHASE_INVOICE, (current_time, invoice_id))
             else:
-                cursor.execute("""
-                    INSERT INTO purchase_invoices
-                    (year_month, company_name, created_at, updated_at)
-                    VALUES (?, ?, ?, ?)
-                """, (year_month, company_name, current_time, current_time))
+                cursor.execute(_SQL_INSERT_PURCHASE_INVOICE, (
+                    year_month, company_name, normalize_company_name(company_name),
+                    current_time, current_time,
+                ))
                 invoice_id = cursor.lastrowid
 
             saved_count = 0
+            items_by_note: dict[int, list[tuple]] = {}
             for pi in purchase_invoices:
-                slip = pi.slip_number or ""
-                cursor.execute("""
-                    SELECT id FROM purchase_notes
-                    WHERE purchase_invoice_id = ? AND slip_number = ?
-                """, (invoice_id, slip))
-                existing_note = cursor.fetchone()
-
-                if existing_note:
-                    note_id = existing_note["id"]
-                    cursor.execute("""
-                        UPDATE purchase_notes
-                        SET date = ?, sales_person = ?,
-                            subtotal = ?, tax = ?, total = ?,
-                            is_taxable = ?, updated_at = ?
-                        WHERE id = ?
-                    """, (
-                        pi.date or "",
-                        sales_person_clean,
-                        pi.subtotal,
-                        pi.tax,
-                        pi.total,
-                        1 if pi.is_taxable else 0,
-                        current_time,
-                        note_id,
-                    ))
-                    cursor.execute(
-                        "DELETE FROM purchase_items WHERE purchase_note_id = ?",
-                        (note_id,),
-                    )
-                else:
-                    cursor.execute("""
-                        INSERT INTO purchase_notes
-                        (purchase_invoice_id, slip_number, date, sales_person,
-                         subtotal, tax, total, is_taxable, created_at, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        invoice_id, slip,
-                        pi.date or "",
-                        sales_person_clean,
-                        pi.subtotal,
-                        pi.tax,
-                        pi.total,
-                        1 if pi.is_taxable else 0,
-                        current_time, current_time,
-                    ))
-                    note_id = cursor.lastrowid
+                cursor.execute(_SQL_UPSERT_PURCHASE_NOTE, (
+                    invoice_id,
+                    pi.slip_number or "",
+                    pi.date or "",
+                    sales_person_clean,
+                    pi.subtotal,
+                    pi.tax,
+                    pi.total,
+                    1 if pi.is_taxable else 0,
+                    current_time,
+                    current_time,
+                ))
+                note_id = cursor.fetchone()["id"]
+                # 既存itemsは削除して再作成（新規伝票なら対象なし）
+                cursor.execute(
+                    _SQL_DELETE_PURCHASE_NOTE_ITEMS,
+                    (note_id,),
+                )
 
-                for item in pi.items:
-                    cursor.execute("""
-                        INSERT INTO purchase_items
-                        (purchase_note_id, product_code, product_name,
-                         quantity, unit_price, amount)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (
-                        note_id,
-                        item.product_code or "",
-                        item.product_name,
-                        item.quantity,
-                        item.unit_price,
-                        item.amount,
-                    ))
+                # 明細は伝票ごとに集めて最後に executemany で一括INSERT
+                # （同一伝票番号が重複した場合は後勝ち＝従来の DELETE→INSERT と同じ結果）
+                items_by_note[note_id] = [
+                    (note_id, code or "", name, quantity, unit_price, amount)
+                    for code, name, quantity, unit_price, amount
+                    in map(_ITEM_FIELDS, pi.items)
+                ]
                 saved_count += 1
 
+            cursor.executemany(
+                _SQL_INSERT_PURCHASE_ITEM,
+                [row for rows in items_by_note.values() for row in rows],
+            )
+
             if request_id:
                 cursor.execute(
-                    "INSERT OR IGNORE INTO save_requests (request_id, created_at) VALUES (?, ?)",
+                    _SQL_RECORD_REQUEST_ID,
                     (request_id, current_time),
                 )
 
             print(f"    仕入れDB一括保存: {company_name} ({year_month}) - {saved_count}件")
-            return saved_count
+            return saved_count, []
 
     def get_purchase_items(
         self,
@@ -1479,55 +1807,43 @@ class MonthlyItemsDB:
 
             invoice_id, _ = result
 
+            # purchase_notes と purchase_items を1回の JOIN で取得（明細の無い伝票も残す）
+            cursor = self._tuple_cursor(conn)
             if sales_person:
-                cursor.execute("""
-                    SELECT id, slip_number, date, sales_person,
-                           subtotal, tax, total, is_taxable
-                    FROM purchase_notes
-                    WHERE purchase_invoice_id = ? AND sales_person = ?
-                    ORDER BY id
-                """, (invoice_id, sales_person))
+                cursor.execute(
+                    _SQL_SELECT_PURCHASE_NOTES_WITH_ITEMS_BY_PERSON,
+                    (invoice_id, sales_person),
+                )
             else:
-                cursor.execute("""
-                    SELECT id, slip_number, date, sales_person,
-                           subtotal, tax, total, is_taxable
-                    FROM purchase_notes
-                    WHERE purchase_invoice_id = ?
-                    ORDER BY id
-                """, (invoice_id,))
-            note_rows = cursor.fetchall()
+                cursor.execute(_SQL_SELECT_PURCHASE_NOTES_WITH_ITEMS_ALL, (invoice_id,))
 
             results = []
-            for note_row in note_rows:
-                cursor.execute("""
-                    SELECT product_code, product_name, quantity,
-                           unit_price, amount
-                    FROM purchase_items
-                    WHERE purchase_note_id = ?
-                    ORDER BY id
-                """, (note_row["id"],))
-                item_rows = cursor.fetchall()
-
+            for note_id, rows in groupby(cursor, key=itemgetter(0)):
+                rows = list(rows)
+                (_, slip_number, date, note_sales_person,
+                 subtotal, tax, total, is_taxable) = rows[0][:8]
                 items = [
                     {
-                        "product_code": row["product_code"],
-                        "product_name": row["product_name"],
-                        "quantity": row["quantity"],
-                        "unit_price": row["unit_price"],
-                        "amount": row["amount"],
+                        "product_code": product_code,
+                        "product_name": product_name,
+                        "quantity": quantity,
+                        "unit_price": unit_price,
+                        "amount": amount,
                     }
-                    for row in item_rows
+                    for (*_, item_id, product_code, product_name,
+                         quantity, unit_price, amount) in rows
+                    if item_id is not None
                 ]
 
                 results.append({
-                    "id": note_row["id"],
-                    "slip_number": note_row["slip_number"],
-                    "date": note_row["date"],
-                    "sales_person": note_row["sales_person"],
-                    "subtotal": note_row["subtotal"],
-                    "tax": note_row["tax"],
-                    "total": note_row["total"],
-                    "is_taxable": bool(note_row["is_taxable"]),
+                    "id": note_id,
+                    "slip_number": slip_number,
+                    "date": date,
+                    "sales_person": note_sales_person,
+                    "subtotal": subtotal,
+                    "tax": tax,
+                    "total": total,
+                    "is_taxable": bool(is_taxable),
                     "items": items,
                 })
 
@@ -1542,7 +1858,7 @@ class MonthlyItemsDB:
                 FROM purchase_invoices
                 ORDER BY company_name
             """)
-            return [row["company_name"] for row in cursor.fetchall()]
+            return [row["company_name"] for row in cursor]
 
     def get_purchase_sales_persons(self, company_name: str = "") -> list[str]:
         """仕入れDBに保存されている担当者名を取得"""
@@ -1563,11 +1879,11 @@ class MonthlyItemsDB:
                     WHERE sales_person != ''
                     ORDER BY sales_person
                 """)
-            return [row["sales_person"] for row in cursor.fetchall()]
+            return [row["sales_person"] for row in cursor]
 
     def get_purchase_notes_with_ids(
         self, company_name: str, year_month: str
-    ) -> list[dict]:
+    ) -> list[PurchaseNoteRow]:
         """仕入れDBの納品書一覧をID付きで返す（編集画面用）"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -1576,6 +1892,7 @@ class MonthlyItemsDB:
                 return []
 
             invoice_id, _ = result
+            cursor = self._tuple_cursor(conn)
             cursor.execute("""
                 SELECT id, slip_number, date, subtotal, tax, total, is_taxable
                 FROM purchase_notes
@@ -1583,16 +1900,10 @@ class MonthlyItemsDB:
                 ORDER BY id
             """, (invoice_id,))
             return [
-                {
-                    "id": row["id"],
-                    "slip_number": row["slip_number"],
-                    "date": row["date"],
-                    "subtotal": row["subtotal"],
-                    "tax": row["tax"],
-                    "total": row["total"],
-                    "is_taxable": bool(row["is_taxable"]),
-                }
-                for row in cursor.fetchall()
+                PurchaseNoteRow(
+                    note_id, slip_number, date, subtotal, tax, total, bool(is_taxable),
+                )
+                for note_id, slip_number, date, subtotal, tax, total, is_taxable in cursor
             ]
 
     def update_purchase_note_amounts(
@@ -1600,7 +1911,7 @@ class MonthlyItemsDB:
     ):
         """指定IDの purchase_note の金額を更新"""
         current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-        with self._get_connection() as conn:
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 UPDATE purchase_notes
@@ -1614,7 +1925,7 @@ class MonthlyItemsDB:
         purchase_items は ON DELETE CASCADE で自動削除される。
         削除した行があれば True、対象が無ければ False を返す。
         """
-        with self._get_connection() as conn:
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "DELETE FROM purchase_notes WHERE id = ?", (note_id,)
@@ -1636,7 +1947,7 @@ class MonthlyItemsDB:
         opening_balance/note は None 指定時は既存値を保持。新規行作成時は 0/"" が入る。
         """
         current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-        with self._get_connection() as conn:
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT id, opening_balance, note FROM monthly_payments
@@ -1849,7 +2160,7 @@ class MonthlyItemsDB:
                     "opening_balance": row["opening_balance"],
                     "note": row["note"],
                 }
-                for row in cursor.fetchall()
+                for row in cursor
             ]
 
     # --- 仕入入金管理 (Phase 1: DB-as-truth) ---
@@ -1869,7 +2180,7 @@ class MonthlyItemsDB:
             note: None の場合は既存値を保持（新規行作成時は ""）
         """
         current_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-        with self._get_connection() as conn:
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT id, payment_amount, note FROM purchase_payments
@@ -1952,10 +2263,31 @@ class MonthlyItemsDB:
                     "payment_amount": row["payment_amount"],
                     "note": row["note"],
                 }
-                for row in cursor.fetchall()
+                for row in cursor
             ]
 
 
+_shared_db: Optional[MonthlyItemsDB] = None
+_shared_db_lock = threading.Lock()
+
+
+def get_shared_db() -> MonthlyItemsDB:
+    """プロセス内で共有する MonthlyItemsDB を返す
+
+    生成のたびにテーブル初期化と接続確立が走るのを避けるため、API などの
+    長寿命プロセスではこちらを使う。接続はスレッドごとに1本保持され、
+    プロセス終了時に閉じる。
+    """
+    global _shared_db
+    if _shared_db is None:
+        with _shared_db_lock:
+            if _shared_db is None:
+                db = MonthlyItemsDB()
+                atexit.register(db.close)
+                _shared_db = db
+    return _shared_db
+
+
 def _shift_year_month(year_month: str, delta_months: int) -> Optional[str]:
     """'YYYY年M月' を delta_months ずらす。パース失敗時は None"""
     import re as _re
@@ -19,7 +19,7 @@ from pathlib import Path
 from typing import Optional
 
 from .claude_extractor import ClaudeExtractor
-from .llm_extractor import LLMExtractor
+from .llm_extractor import ExtractionCache, LLMExtractor
 from .pdf_extractor import DeliveryNote
 
 
@@ -27,18 +27,22 @@ from .pdf_extractor import DeliveryNote
 DEFAULT_BACKEND = "claude"
 
 
-def get_extractor(backend: Optional[str] = None):
+def get_extractor(
+    backend: Optional[str] = None,
+    cache: Optional[ExtractionCache] = None,
+):
     """指定バックエンドの抽出器インスタンスを返す。
 
     backend を省略すると環境変数 EXTRACTOR_BACKEND を参照。それも無ければ DEFAULT_BACKEND ("claude")。
+    cache を渡すと同じPDFの再抽出で LLM 呼び出しを省く。
     """
     if backend is None:
         backend = os.getenv("EXTRACTOR_BACKEND", DEFAULT_BACKEND)
     backend = backend.lower().strip()
     if backend == "claude":
-        return ClaudeExtractor()
+        return ClaudeExtractor(cache=cache)
     if backend == "gemini":
-        return LLMExtractor()
+        return LLMExtractor(cache=cache)
     raise ValueError(
         f"未知のバックエンド: '{backend}'. 'claude' or 'gemini' を指定してください"
     )
@@ -71,8 +75,12 @@ def apply_filename_unit_price_override(filename: str, dn: DeliveryNote) -> Deliv
 class UnifiedExtractor:
     """ファクトリ + ファイル名後処理を組み込んだ統合抽出器"""
 
-    def __init__(self, backend: Optional[str] = None):
-        self._impl = get_extractor(backend)
+    def __init__(
+        self,
+        backend: Optional[str] = None,
+        cache: Optional[ExtractionCache] = None,
+    ):
+        self._impl = get_extractor(backend, cache)
         self._backend = backend or os.getenv("EXTRACTOR_BACKEND", DEFAULT_BACKEND)
 
     @property
@@ -2,8 +2,11 @@
 
 画像サンプルに基づいた日本式請求書フォーマット
 """
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+import calendar
+from dataclasses import dataclass, replace
+from datetime import datetime
+from functools import lru_cache
+from itertools import accumulate, chain, islice
 from pathlib import Path
 from typing import Optional
 
@@ -19,6 +22,44 @@ from .pdf_extractor import DeliveryNote, DeliveryItem
 from .sheets_client import CompanyInfo, PreviousBilling
 
 
+# 登録済みフォント（フォントパス → 使用するフォント名）。TTF の解析・登録はプロセスで1回
+_registered_fonts: dict[str, str] = {}
+
+
+@lru_cache(maxsize=4096)
+def _string_width(text: str, font_name: str, size: float) -> float:
+    """文字列幅（見出し・ページ番号や、明細の数量・単価・金額など繰り返し出る文字列が大半なのでキャッシュ）"""
+    return pdfmetrics.stringWidth(text, font_name, size)
+
+
+@lru_cache(maxsize=128)
+def _month_end_day(year: int, month: int) -> int:
+    """月末日（同じ締め月の請求書を続けて作るのでキャッシュ）"""
+    return calendar.monthrange(year, month)[1]
+
+
+@lru_cache(maxsize=4096)
+def _format_amount(amount: int) -> str:
+    """金額の3桁区切り（同じ単価・金額が明細に繰り返し出るのでキャッシュ）"""
+    return f"{amount:,}"
+
+
+@lru_cache(maxsize=512)
+def _short_date(date: str) -> str:
+    """明細の日付 YYYY/M/D → YY/MM/DD（同じ日付の明細が多いのでキャッシュ）
+
+    "/" 区切りの3要素でなければそのまま返す。
+    """
+    parts = date.split("/")
+    if len(parts) != 3:
+        return date
+    year = parts[0]
+    # YYYYが4桁の場合のみ下2桁を取得
+    if len(year) == 4:
+        year = year[2:]
+    return f"{year}/{parts[1].zfill(2)}/{parts[2].zfill(2)}"
+
+
 @dataclass
 class InvoiceData:
     """請求書データ"""
@@ -51,15 +92,38 @@ class InvoiceGenerator:
     PAGE_WIDTH, PAGE_HEIGHT = A4  # 縦向きA4
     ITEMS_PER_PAGE = 18  # 1ページあたりの最大明細行数（ページ累計行を含まない）
 
+    # 明細テーブルのカラム定義（見出し, 幅）。ページ累計列なし
+    DETAIL_COLUMNS = (
+        ("日付", 18 * mm),
+        ("伝票番号", 18 * mm),
+        ("商品コード", 25 * mm),
+        ("品      名", 50 * mm),
+        ("数量", 12 * mm),
+        ("単価", 18 * mm),
+        ("金額", 20 * mm),
+    )
+    DETAIL_COL_WIDTHS = [col_width for _, col_width in DETAIL_COLUMNS]
+    # 各列の左端（表の左端からのオフセット）
+    DETAIL_COL_OFFSETS = list(accumulate(DETAIL_COL_WIDTHS[:-1], initial=0))
+
     def __init__(self, font_path: Optional[str] = None):
         self.font_path = font_path or PDF_FONT_PATH
         self._font_registered = False
 
     def _register_font(self):
-        """日本語フォントを登録"""
+        """日本語フォントを登録
+
+        同じフォントパスは2回目以降（別インスタンスでも）登録済みの結果を使う。
+        """
         if self._font_registered:
             return
 
+        font_key = str(self.font_path)
+        if font_key in _registered_fonts:
+            self.FONT_NAME = _registered_fonts[font_key]
+            self._font_registered = True
+            return
+
         try:
             print(f"[DEBUG] Attempting to register font: {self.font_path}")
             from pathlib import Path
@@ -69,6 +133,7 @@ class InvoiceGenerator:
 
             pdfmetrics.registerFont(TTFont(self.FONT_NAME, str(self.font_path)))
             self._font_registered = True
+            _registered_fonts[font_key] = self.FONT_NAME
             print(f"[DEBUG] Font '{self.FONT_NAME}' registered successfully")
         except Exception as e:
             # フォントが見つからない場合はデフォルトフォントを使用
@@ -77,6 +142,7 @@ class InvoiceGenerator:
             print(f"   Helvetica フォントにフォールバックします（日本語表示不可）")
             self.FONT_NAME = "Helvetica"
             self._font_registered = True
+            _registered_fonts[font_key] = self.FONT_NAME
 
     def generate(
         self,
@@ -115,11 +181,7 @@ class InvoiceGenerator:
                 closing_date = f"{year}年{month}月分 (月次請求書)"
             else:
                 # 通常モード: 月末締切
-                if month == 12:
-                    next_month = datetime(year + 1, 1, 1)
-                else:
-                    next_month = datetime(year, month + 1, 1)
-                last_day = (next_month - timedelta(days=1)).day
+                last_day = _month_end_day(year, month)
                 closing_date = f"{year}年{month}月{last_day}日締切分"
         except (ValueError, IndexError):
             closing_date = f"{date_str} 締切分"
@@ -189,9 +251,15 @@ class InvoiceGenerator:
             Path: 生成されたPDFファイルのパス
         """
         # 明細を納品日ごとにグループ化してセパレーター付きで結合
+        # （全納品書の合計も同じループで計算）
         all_items = []
+        total_subtotal = 0
+        total_tax = 0
 
         for note in delivery_notes:
+            total_subtotal += note.subtotal
+            total_tax += note.tax
+
             # セパレーター行を追加
             separator = DeliveryItem(
                 slip_number="",
@@ -204,22 +272,9 @@ class InvoiceGenerator:
             )
             all_items.append(separator)
 
-            # 納品書の明細を追加（各アイテムに納品日を設定）
-            for item in note.items:
-                item_with_date = DeliveryItem(
-                    slip_number=item.slip_number,
-                    product_code=item.product_code,
-                    product_name=item.product_name,
-                    quantity=item.quantity,
-                    unit_price=item.unit_price,
-                    amount=item.amount,
-                    date=note.date,
-                )
-                all_items.append(item_with_date)
-
-        # 全納品書の合計を計算
-        total_subtotal = sum(note.subtotal for note in delivery_notes)
-        total_tax = sum(note.tax for note in delivery_notes)
+            # 納品書の明細を追加（各アイテムに納品日を設定。呼び出し元の明細は書き換えない）
+            all_items.extend(replace(item, date=note.date) for item in note.items)
+
         total_amount = total_subtotal + total_tax
 
         # 代表の納品書データを作成（明細は結合したもの）
@@ -255,7 +310,7 @@ class InvoiceGenerator:
         width, height = A4
 
         # 明細を準備（前回請求額を先頭に追加）
-        all_items = []
+        lead_items = []
 
         # 前回請求額がある場合、先頭に追加
         if data.previous_amount > 0:
@@ -267,13 +322,14 @@ class InvoiceGenerator:
                 unit_price=0,
                 amount=data.previous_amount,
             )
-            all_items.append(prev_item)
+            lead_items.append(prev_item)
 
-        # 実際の明細を追加
-        all_items.extend(data.items)
+        # 実際の明細は結合リストを作らず、先頭行に続けて順に読む
+        item_count = len(lead_items) + len(data.items)
+        all_items = chain(lead_items, data.items)
 
         # ページ分割
-        total_pages = (len(all_items) + self.ITEMS_PER_PAGE - 1) // self.ITEMS_PER_PAGE
+        total_pages = (item_count + self.ITEMS_PER_PAGE - 1) // self.ITEMS_PER_PAGE
         if total_pages == 0:
             total_pages = 1
 
@@ -281,9 +337,7 @@ class InvoiceGenerator:
             if page_num > 0:
                 c.showPage()  # 新しいページ
 
-            start_idx = page_num * self.ITEMS_PER_PAGE
-            end_idx = min(start_idx + self.ITEMS_PER_PAGE, len(all_items))
-            page_items = all_items[start_idx:end_idx]
+            page_items = list(islice(all_items, self.ITEMS_PER_PAGE))
 
             self._draw_page(c, data, page_items, page_num + 1, total_pages, width, height)
 
@@ -335,7 +389,7 @@ class InvoiceGenerator:
         c.setFont(self.FONT_NAME, 24)
         # タイトルを中央に配置
         title = "請  求  書"
-        title_width = c.stringWidth(title, self.FONT_NAME, 24)
+        title_width = _string_width(title, self.FONT_NAME, 24)
         c.drawString((width - title_width) / 2, height - margin_top - 15 * mm, title)
 
     def _draw_customer_info(self, c, data: InvoiceData, x, y):
@@ -406,159 +460,152 @@ class InvoiceGenerator:
         col_width = 28 * mm
         row_height = 8 * mm
 
+        # 罫線（2行 × 6列）をまとめて描画
+        self._draw_grid(c, x, y, [col_width] * len(columns), [row_height, row_height])
+
         # ヘッダー行（列名）
         current_x = x
         for col_name, _ in columns:
-            c.rect(current_x, y - row_height, col_width, row_height)
             # テキストを中央に配置
-            text_width = c.stringWidth(col_name, self.FONT_NAME, 9)
+            text_width = _string_width(col_name, self.FONT_NAME, 9)
             c.drawString(current_x + (col_width - text_width) / 2, y - row_height + 2.5 * mm, col_name)
             current_x += col_width
 
         # データ行（金額）
         y -= row_height
         current_x = x
-        for i, (_, value) in enumerate(columns):
-            # 今回御請求額は太枠
-            if i == len(columns) - 1:
-                c.setLineWidth(1.5)
-            else:
-                c.setLineWidth(0.5)
-
-            c.rect(current_x, y - row_height, col_width, row_height)
-
+        for _, value in columns:
             # 金額を右寄せで表示
-            c.drawRightString(current_x + col_width - 2 * mm, y - row_height + 2.5 * mm, f"{value:,}")
+            c.drawRightString(current_x + col_width - 2 * mm, y - row_height + 2.5 * mm, _format_amount(value))
             current_x += col_width
 
+        # 今回御請求額は太枠
+        c.setLineWidth(1.5)
+        c.rect(current_x - col_width, y - row_height, col_width, row_height)
+
     def _draw_detail_table(self, c, data: InvoiceData, page_items: list, x, y, table_width, page_num: int):
         """明細テーブルを描画（ページ累計列なし、ページ累計行あり）"""
-        # カラム定義（ページ累計列を削除）
-        columns = [
-            ("日付", 18 * mm),
-            ("伝票番号", 18 * mm),
-            ("商品コード", 25 * mm),
-            ("品      名", 50 * mm),
-            ("数量", 12 * mm),
-            ("単価", 18 * mm),
-            ("金額", 20 * mm),
-        ]
+        columns = self.DETAIL_COLUMNS
 
         row_height = 6 * mm
         header_height = 8 * mm
 
-        # ヘッダー描画
-        c.setFont(self.FONT_NAME, 9)
         c.setStrokeColor(colors.black)
         c.setLineWidth(0.5)
 
-        current_x = x
-        for col_name, col_width in columns:
-            # ヘッダーセル
-            c.rect(current_x, y - header_height, col_width, header_height)
+        # 文字はページ内の表全体で1つのテキストオブジェクトにまとめて描画
+        # （drawString ごとに BT/ET を出さない）
+        font_name = self.FONT_NAME
+        text = c.beginText()
+
+        def put(text_x, text_y, s: str):
+            if s:
+                text.setTextOrigin(text_x, text_y)
+                text.textOut(s)
+
+        def put_right(right_x, text_y, s: str, size):
+            text.setTextOrigin(right_x - _string_width(s, font_name, size), text_y)
+            text.textOut(s)
+
+        # 各列の左端X と、セル内の文字の基準X（左寄せは左端+1mm、右寄せは右端-1mm）
+        col_xs = [x + offset for offset in self.DETAIL_COL_OFFSETS]
+        date_x, slip_x, code_x, name_x = (col_x + 1 * mm for col_x in col_xs[:4])
+        qty_right, price_right, amount_right = (
+            col_x + col_width - 1 * mm
+            for col_x, col_width in zip(col_xs[4:], self.DETAIL_COL_WIDTHS[4:])
+        )
+
+        # ヘッダー描画
+        text.setFont(font_name, 9)
+        for (col_name, col_width), col_x in zip(columns, col_xs):
             # テキストを中央に
-            text_width = c.stringWidth(col_name, self.FONT_NAME, 9)
-            c.drawString(current_x + (col_width - text_width) / 2, y - header_height + 2.5 * mm, col_name)
-            current_x += col_width
+            text_width = _string_width(col_name, font_name, 9)
+            put(col_x + (col_width - text_width) / 2, y - header_height + 2.5 * mm, col_name)
 
         # データ行描画
         data_y = y - header_height
         page_total_quantity = 0
         page_total_amount = 0
-        c.setFont(self.FONT_NAME, 8)
+        text.setFont(font_name, 8)
 
         for item in page_items:
             data_y -= row_height
-            current_x = x
+            text_y = data_y + 1.5 * mm
 
             # 日付（アイテムにdateがあればそれを使用、なければdata.dateを使用）
-            item_date = getattr(item, 'date', '') or data.date
-            date_str = ""
-            if item_date:
-                try:
-                    # YYYY/MM/DD → YY/MM/DD に変換
-                    parts = item_date.split("/")
-                    if len(parts) == 3:
-                        # YYYYが4桁の場合のみ下2桁を取得
-                        year = parts[0]
-                        if len(year) == 4:
-                            date_str = f"{year[2:]}/{parts[1].zfill(2)}/{parts[2].zfill(2)}"
-                        else:
-                            date_str = f"{year}/{parts[1].zfill(2)}/{parts[2].zfill(2)}"
-                    else:
-                        date_str = item_date
-                except Exception as e:
-                    print(f"日付変換エラー: {item_date} -> {e}")
-                    date_str = item_date
-
-            c.rect(current_x, data_y, columns[0][1], row_height)
-            c.drawString(current_x + 1 * mm, data_y + 1.5 * mm, date_str)
-            current_x += columns[0][1]
+            item_date = item.date or data.date
+            date_str = _short_date(item_date) if item_date else ""
+            put(date_x, text_y, date_str)
 
             # 伝票番号（明細行の伝票番号を使用、"None"の場合は空欄に）
             # 伝票番号がない場合は日付列を空欄にする
             slip_num = ""
             if item.slip_number and item.slip_number != "None" and len(item.slip_number.strip()) > 0:
                 slip_num = item.slip_number[:10]
-            c.rect(current_x, data_y, columns[1][1], row_height)
-            c.drawString(current_x + 1 * mm, data_y + 1.5 * mm, slip_num)
-            current_x += columns[1][1]
+            put(slip_x, text_y, slip_num)
 
             # 商品コード（"None"の場合は空欄に）
             prod_code = item.product_code[:15] if item.product_code and item.product_code != "None" else ""
-            c.rect(current_x, data_y, columns[2][1], row_height)
-            c.drawString(current_x + 1 * mm, data_y + 1.5 * mm, prod_code)
-            current_x += columns[2][1]
+            put(code_x, text_y, prod_code)
 
             # 品名（短く切り詰める）
-            c.rect(current_x, data_y, columns[3][1], row_height)
-            c.drawString(current_x + 1 * mm, data_y + 1.5 * mm, item.product_name[:30])
-            current_x += columns[3][1]
+            put(name_x, text_y, item.product_name[:30])
 
             # 数量
-            c.rect(current_x, data_y, columns[4][1], row_height)
             if item.quantity > 0:  # 数量が0の場合は表示しない（前回請求額など）
-                c.drawRightString(current_x + columns[4][1] - 1 * mm, data_y + 1.5 * mm, str(item.quantity))
+                put_right(qty_right, text_y, str(item.quantity), 8)
                 page_total_quantity += item.quantity
-            current_x += columns[4][1]
 
             # 単価
-            c.rect(current_x, data_y, columns[5][1], row_height)
             if item.unit_price > 0:
-                c.drawRightString(current_x + columns[5][1] - 1 * mm, data_y + 1.5 * mm, f"{item.unit_price:,}")
-            current_x += columns[5][1]
+                put_right(price_right, text_y, _format_amount(item.unit_price), 8)
 
             # 金額
-            c.rect(current_x, data_y, columns[6][1], row_height)
-            c.drawRightString(current_x + columns[6][1] - 1 * mm, data_y + 1.5 * mm, f"{item.amount:,}")
+            put_right(amount_right, text_y, _format_amount(item.amount), 8)
             page_total_amount += item.amount
-            current_x += columns[6][1]
 
         # ページ累計行を追加
         data_y -= row_height
-        current_x = x
+        text_y = data_y + 1.5 * mm
 
-        for j, (_, col_width) in enumerate(columns):
-            c.rect(current_x, data_y, col_width, row_height)
-            if j == 3:  # 品名列に「ページ累計」
-                c.setFont(self.FONT_NAME, 9)
-                c.drawString(current_x + 1 * mm, data_y + 1.5 * mm, "ページ累計")
-                c.setFont(self.FONT_NAME, 8)
-            elif j == 4:  # 数量列
-                if page_total_quantity > 0:
-                    c.drawRightString(current_x + col_width - 1 * mm, data_y + 1.5 * mm, str(page_total_quantity))
-            elif j == 6:  # 金額列
-                c.drawRightString(current_x + col_width - 1 * mm, data_y + 1.5 * mm, f"{page_total_amount:,}")
-            current_x += col_width
+        # 品名列に「ページ累計」
+        text.setFont(font_name, 9)
+        put(name_x, text_y, "ページ累計")
+        text.setFont(font_name, 8)
+        # 数量列
+        if page_total_quantity > 0:
+            put_right(qty_right, text_y, str(page_total_quantity), 8)
+        # 金額列
+        put_right(amount_right, text_y, _format_amount(page_total_amount), 8)
 
-        # 空行を追加して表を埋める（必要に応じて）
-        remaining_rows = self.ITEMS_PER_PAGE - len(page_items)
-        for _ in range(max(0, remaining_rows)):
-            data_y -= row_height
-            current_x = x
-            for _, col_width in columns:
-                c.rect(current_x, data_y, col_width, row_height)
-                current_x += col_width
+        c.drawText(text)
+
+        # 罫線: ヘッダー・明細・ページ累計行に、表を埋める空行を加えた格子を1つのパスで描画
+        remaining_rows = max(0, self.ITEMS_PER_PAGE - len(page_items))
+        row_heights = [header_height] + [row_height] * (len(page_items) + 1 + remaining_rows)
+        self._draw_grid(c, x, y, self.DETAIL_COL_WIDTHS, row_heights)
+
+    def _draw_grid(self, c, x, top, col_widths: list, row_heights: list):
+        """表の罫線を1つのパスで描画（セルごとに rect を描く代わり）
+
+        外枠を1つの矩形、内側の罫線を列・行の境界ごとの線分として描く。
+        """
+        right = x + sum(col_widths)
+        bottom = top - sum(row_heights)
+
+        path = c.beginPath()
+        path.rect(x, bottom, right - x, top - bottom)
+        col_x = x
+        for col_width in col_widths[:-1]:
+            col_x += col_width
+            path.moveTo(col_x, top)
+            path.lineTo(col_x, bottom)
+        row_y = top
+        for row_height in row_heights[:-1]:
+            row_y -= row_height
+            path.moveTo(x, row_y)
+            path.lineTo(right, row_y)
+        c.drawPath(path, stroke=1, fill=0)
 
     def _draw_page_info(self, c, data: InvoiceData, x, y, page_num: int):
         """ページ番号と請求書番号を描画（右上）"""
@@ -566,7 +613,7 @@ class InvoiceGenerator:
 
         # "No." の文字列
         no_text = "No."
-        no_width = c.stringWidth(no_text, self.FONT_NAME, 9)
+        no_width = _string_width(no_text, self.FONT_NAME, 9)
 
         # 1行目: ページ番号
         page_text = f"No.     {page_num}"
@@ -575,7 +622,7 @@ class InvoiceGenerator:
         # "No." に下線を引く
         c.setLineWidth(0.5)
         # 右端からページ番号全体の幅を引き、さらに "No." の幅を足して位置を調整
-        page_text_width = c.stringWidth(page_text, self.FONT_NAME, 9)
+        page_text_width = _string_width(page_text, self.FONT_NAME, 9)
         underline_x_start = x - page_text_width
         underline_x_end = underline_x_start + no_width
         c.line(underline_x_start, y - 1 * mm, underline_x_end, y - 1 * mm)
@@ -585,4 +632,4 @@ class InvoiceGenerator:
 
     def _format_currency(self, amount: int) -> str:
         """金額をフォーマット"""
-        return f"{amount:,}"
+        return _format_amount(amount)
@@ -2,14 +2,19 @@
 
 PDFから情報抽出：Gemini APIに直接画像を送信して構造化データを抽出
 """
+import hashlib
 import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from pathlib import Path
 from typing import Optional
 
 from google import genai
 from google.genai import types
-from pdf2image import convert_from_path
+import fitz  # PyMuPDF
 from PIL import Image
 
 from .config import GEMINI_API_KEY, GEMINI_MODEL, load_company_config
@@ -136,12 +141,103 @@ EXTRACTION_PROMPT = """以下は納品書の画像です。この画像から情
 JSONのみを出力してください。説明は不要です。"""
 
 
+def pdf_to_images(pdf_path: Path, dpi: int = 300) -> list[Image.Image]:
+    """PDFの各ページを画像に変換（PyMuPDFでプロセス内ラスタライズ）
+
+    pdf2image は poppler (pdftoppm) をサブプロセスで起動し、ページごとに
+    PPM を一時ファイル経由で読み戻すため遅い。PyMuPDF ならプロセス内で
+    直接ピクセルバッファを得られる。解像度は読み取り精度向上のため高めの 300dpi。
+    """
+    images = []
+    doc = fitz.open(str(pdf_path))
+    try:
+        for page in doc:
+            pix = page.get_pixmap(dpi=dpi, alpha=False)
+            images.append(
+                Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+            )
+    finally:
+        doc.close()
+    return images
+
+
+# ページ画像のエンコード並列数（エンコード中は GIL が解放されるのでスレッドで効く）
+_IMAGE_ENCODE_WORKERS = 4
+
+# 送信用ページ画像の JPEG 品質。スキャン画像は PNG だと数倍のサイズになるが、
+# 読み取り精度は q=85 の JPEG でも変わらない
+JPEG_QUALITY = 85
+
+
+def encode_jpeg(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+# 静的プロンプトの Gemini コンテキストキャッシュ
+# (api_key, model, prompt) → (キャッシュ名, 作り直す時刻)。キャッシュ名が空なら作成失敗・作成中（キャッシュなしで送信）
+_PROMPT_CACHE_TTL_SECONDS = 3600
+# 作成失敗時（・作成中）にキャッシュなしで送信する期間
+_PROMPT_CACHE_RETRY_SECONDS = 60
+_prompt_caches: dict[tuple[str, str, str], tuple[str, float]] = {}
+_prompt_caches_lock = threading.Lock()
+
+
+# 抽出キャッシュのキーに含めるプロンプト版数（プロンプトを変えれば自動的に別キーになる）
+PROMPT_VERSION = hashlib.sha256(EXTRACTION_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+class ExtractionCache:
+    """LLM抽出結果（応答JSON）のファイルキャッシュ
+
+    キーは PDF 内容の sha256・モデル名・PROMPT_VERSION。自社名フィルタ等の後処理は
+    設定に依存するのでキャッシュせず、ヒット時も毎回実行する。
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(pdf_path: Path, model: str) -> str:
+        digest = hashlib.sha256(Path(pdf_path).read_bytes())
+        digest.update(f"\0{model}\0{PROMPT_VERSION}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """キャッシュ済みの応答JSONを返す（無い・壊れている場合は None）"""
+        try:
+            with open(self.cache_dir / f"{key}.json", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, extracted) -> None:
+        """応答JSONを保存（一時ファイル経由で置き換え、並行実行でも壊れたファイルを残さない）"""
+        path = self.cache_dir / f"{key}.json"
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(extracted, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"  ⚠️ 抽出キャッシュの保存に失敗: {e}")
+            tmp.unlink(missing_ok=True)
+
+
 class LLMExtractor:
     """Gemini APIで納品書から情報を抽出するクラス"""
 
-    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        cache: Optional[ExtractionCache] = None,
+    ):
         self.api_key = api_key or GEMINI_API_KEY
         self.model = model or GEMINI_MODEL
+        self.cache = cache
 
         # API キーの検証
         if not self.api_key:
@@ -162,16 +258,33 @@ class LLMExtractor:
         Returns:
             DeliveryNote: 抽出された納品書データ
         """
+        # 同じPDF・モデル・プロンプトの抽出結果があれば画像変換とLLM呼び出しを省く
+        cache_key = self.cache.key(pdf_path, self.model) if self.cache else None
+        extracted = self.cache.get(cache_key) if cache_key else None
+        if extracted is not None:
+            print(f"  抽出キャッシュにヒット: {cache_key[:12]}")
+        else:
+            extracted = self._extract_raw(pdf_path)
+            if cache_key:
+                self.cache.put(cache_key, extracted)
+
+        return self._postprocess(extracted)
+
+    def _extract_raw(self, pdf_path: Path):
+        """PDFを画像化してGeminiで抽出し、応答JSON（dict または list）をそのまま返す"""
         # PDFを画像に変換
         images = self._pdf_to_images(pdf_path)
         print(f"  PDF → {len(images)} ページの画像に変換")
 
+        # 画像パーツはリトライ間で使い回す（試行ごとに再エンコードしない）
+        image_parts = self._image_parts(images)
+
         # Geminiに直接画像を送信して構造化抽出（リトライ付き）
         max_retries = 6
         extracted = None
         for attempt in range(1, max_retries + 1):
             print(f"\n=== Gemini APIに画像を直接送信中 (試行 {attempt}/{max_retries}) ===")
-            extracted = self._extract_with_gemini(images)
+            extracted = self._extract_with_gemini(image_parts)
             if extracted is not None:
                 print(f"Gemini応答: {extracted}")
                 break
@@ -179,7 +292,10 @@ class LLMExtractor:
 
         if not extracted:
             raise ValueError(f"データの抽出に失敗しました（{max_retries}回リトライ後）")
+        return extracted
 
+    def _postprocess(self, extracted) -> DeliveryNote:
+        """Geminiの応答JSONを検証・整形してDeliveryNoteに変換"""
         # Geminiがリスト（複数納品書）を返した場合、1つにマージ
         if isinstance(extracted, list):
             print(f"  ⚠️ Geminiがリスト({len(extracted)}件)を返却 → 1件にマージ")
@@ -263,33 +379,67 @@ class LLMExtractor:
 
     def _pdf_to_images(self, pdf_path: Path) -> list[Image.Image]:
         """PDFを画像に変換"""
-        images = convert_from_path(
-            str(pdf_path),
-            dpi=300,  # 解像度（読み取り精度向上のため高めに設定）
-        )
-        return images
-
-    def _extract_with_gemini(self, images: list[Image.Image]) -> Optional[dict]:
+        return pdf_to_images(pdf_path)
+
+    @staticmethod
+    def _image_parts(images: list[Image.Image]) -> list[types.Part]:
+        """ページ画像をGemini送信用の画像パーツに変換（JPEG エンコードをページ並列で実行）"""
+        with ThreadPoolExecutor(max_workers=min(_IMAGE_ENCODE_WORKERS, len(images) or 1)) as ex:
+            jpeg_pages = list(ex.map(encode_jpeg, images))
+        return [
+            types.Part.from_bytes(data=jpeg, mime_type="image/jpeg")
+            for jpeg in jpeg_pages
+        ]
+
+    def _prompt_config(self, prompt: str) -> types.GenerateContentConfig:
+        """静的プロンプトを渡す生成設定を返す
+
+        プロンプトはコンテキストキャッシュに載せて使い回す（リクエストごとの入力トークンを削減）。
+        キャッシュは抽出器インスタンスをまたいでプロセス内で共有し、失効前に作り直す。
+        作成に失敗した場合（最小トークン数未満・非対応モデル等）は system_instruction で直接渡す。
+        """
+        key = (self.api_key, self.model, prompt)
+        now = time.monotonic()
+        with _prompt_caches_lock:
+            cached = _prompt_caches.get(key)
+            refresh = cached is None or cached[1] <= now
+            if refresh:
+                # 作成中に他スレッドが重ねて作成しないよう、期限を先送りした仮エントリを置く
+                # （作り直し時は失効まで余裕のある旧キャッシュをそのまま使わせる）
+                cached = (cached[0] if cached else "", now + _PROMPT_CACHE_RETRY_SECONDS)
+                _prompt_caches[key] = cached
+
+        if refresh:
+            # キャッシュ作成（API呼び出し）はロック外で行い、他の抽出を待たせない
+            try:
+                cache = self.gemini_client.caches.create(
+                    model=self.model,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=prompt,
+                        ttl=f"{_PROMPT_CACHE_TTL_SECONDS}s",
+                    ),
+                )
+                # 送信中に失効しないよう 5 分の余裕を持って作り直す
+                cached = (cache.name, now + _PROMPT_CACHE_TTL_SECONDS - 300)
+            except Exception as e:
+                # 一時的な失敗もあり得るので、短い間隔をおいて再作成を試みる
+                print(f"  ⚠️ プロンプトキャッシュ作成失敗（キャッシュなしで送信）: {e}")
+                cached = ("", now + _PROMPT_CACHE_RETRY_SECONDS)
+            with _prompt_caches_lock:
+                _prompt_caches[key] = cached
+
+        if cached[0]:
+            return types.GenerateContentConfig(cached_content=cached[0])
+        return types.GenerateContentConfig(system_instruction=prompt)
+
+    def _extract_with_gemini(self, image_parts: list[types.Part]) -> Optional[dict]:
         """Geminiに画像を直接送信して構造化データを抽出"""
         try:
-            # 画像パーツを作成
-            contents = []
-            for image in images:
-                buffer = BytesIO()
-                image.save(buffer, format="PNG")
-                image_part = types.Part.from_bytes(
-                    data=buffer.getvalue(),
-                    mime_type="image/png",
-                )
-                contents.append(image_part)
-
-            # プロンプトを追加
-            contents.append(EXTRACTION_PROMPT)
-
-            # Gemini APIに送信
+            # Gemini APIに送信（プロンプトはキャッシュ済みのシステム指示として渡す）
             response = self.gemini_client.models.generate_content(
                 model=self.model,
-                contents=contents,
+                contents=image_parts,
+                config=self._prompt_config(EXTRACTION_PROMPT),
             )
             response_text = response.text
 
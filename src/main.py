@@ -13,16 +13,27 @@
     python -m src.main <納品書PDFパス>
     python -m src.main input/delivery_note.pdf
     python -m src.main input/*.pdf  # 複数ファイル処理
+    python -m src.main --cache-dir .cache/extraction input/*.pdf  # 抽出結果をキャッシュ
 """
 import argparse
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Optional
 
 from .config import INPUT_DIR, OUTPUT_DIR
 from .invoice_generator import InvoiceGenerator
 from .extractor import UnifiedExtractor
+from .llm_extractor import ExtractionCache
 from . import sheets_client
 
+# 複数ファイル処理の同時実行数（処理時間の大半は LLM 抽出の待ち時間）
+DEFAULT_WORKERS = 4
+
+# 請求書PDF生成は直列化する（同じ会社・日付の納品書は出力先が同じファイルになる）
+_generate_lock = threading.Lock()
+
 
 def extract_year_month(date_str: str) -> str:
     """日付文字列からYYYY-MM形式の年月を抽出
@@ -41,12 +52,17 @@ def extract_year_month(date_str: str) -> str:
     return ""
 
 
-def process_delivery_note(pdf_path: Path, dry_run: bool = False) -> Path:
+def process_delivery_note(
+    pdf_path: Path,
+    dry_run: bool = False,
+    cache: Optional[ExtractionCache] = None,
+) -> Path:
     """納品書PDFを処理して請求書PDFを生成
 
     Args:
         pdf_path: 納品書PDFのパス
         dry_run: Trueの場合、Google Sheetsへの書き込みをスキップ
+        cache: 抽出結果のキャッシュ（同じPDFの再処理でLLM呼び出しを省く）
 
     Returns:
         生成された請求書PDFのパス
@@ -55,7 +71,7 @@ def process_delivery_note(pdf_path: Path, dry_run: bool = False) -> Path:
 
     # 1. LLMで画像からデータ抽出 (Claude/Gemini を EXTRACTOR_BACKEND env で切替可能)
     print("  - 納品書PDFを画像として読み取り中...")
-    extractor = UnifiedExtractor()
+    extractor = UnifiedExtractor(cache=cache)
     print(f"  - Vision APIでOCR+構造化抽出中... (backend={extractor.backend_name})")
     delivery_note = extractor.extract(pdf_path)
 
@@ -99,11 +115,12 @@ def process_delivery_note(pdf_path: Path, dry_run: bool = False) -> Path:
     # 3. 請求書PDF生成
     print("  - 請求書PDFを生成中...")
     generator = InvoiceGenerator()
-    invoice_path = generator.generate(
-        delivery_note=delivery_note,
-        company_info=company_info,
-        previous_billing=previous_billing,
-    )
+    with _generate_lock:
+        invoice_path = generator.generate(
+            delivery_note=delivery_note,
+            company_info=company_info,
+            previous_billing=previous_billing,
+        )
     print(f"    出力: {invoice_path}")
     # 注: シート保存は廃止（DB-as-truth）。CLIは請求書PDF生成のみ。
 
@@ -126,6 +143,17 @@ def main():
         action="store_true",
         help="Google Sheetsへの書き込みをスキップ（PDF生成のみ）",
     )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        help="抽出結果のキャッシュディレクトリ（同じPDFの再処理でLLM呼び出しを省く）",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"同時に処理するファイル数（デフォルト: {DEFAULT_WORKERS}）",
+    )
 
     args = parser.parse_args()
 
@@ -145,32 +173,47 @@ def main():
     print(f"出力先: {OUTPUT_DIR}")
     if args.dry_run:
         print("モード: DRY RUN（Google Sheetsへの書き込みなし）")
+    if args.cache_dir:
+        print(f"抽出キャッシュ: {args.cache_dir}")
     print("-" * 50)
 
     # 出力ディレクトリを作成
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+    cache = ExtractionCache(args.cache_dir) if args.cache_dir else None
+
     # 各ファイルを処理
     success_count = 0
     error_count = 0
-    generated_files = []
 
+    targets = []
     for pdf_file in pdf_files:
-        try:
-            if not pdf_file.exists():
-                print(f"エラー: ファイルが見つかりません: {pdf_file}")
+        if not pdf_file.exists():
+            print(f"エラー: ファイルが見つかりません: {pdf_file}")
+            error_count += 1
+            continue
+        targets.append(pdf_file)
+
+    # ファイル同士は独立しているので並列に処理する（ログは前後が入り混じる）
+    results: dict[Path, Path] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(args.workers, len(targets) or 1))) as ex:
+        futures = {
+            ex.submit(process_delivery_note, pdf_file, args.dry_run, cache): pdf_file
+            for pdf_file in targets
+        }
+        for future in as_completed(futures):
+            pdf_file = futures[future]
+            try:
+                results[pdf_file] = future.result()
+                success_count += 1
+            except Exception as e:
+                print(f"エラー: {pdf_file} の処理中にエラーが発生しました: {e}")
+                import traceback
+                traceback.print_exc()
                 error_count += 1
-                continue
 
-            invoice_path = process_delivery_note(pdf_file, dry_run=args.dry_run)
-            generated_files.append(invoice_path)
-            success_count += 1
-
-        except Exception as e:
-            print(f"エラー: {pdf_file} の処理中にエラーが発生しました: {e}")
-            import traceback
-            traceback.print_exc()
-            error_count += 1
+    # 一覧は入力順で表示
+    generated_files = [results[f] for f in targets if f in results]
 
     # サマリー
     print("-" * 50)
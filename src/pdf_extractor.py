@@ -5,7 +5,7 @@
 from dataclasses import dataclass, field
 
 
-@dataclass
+@dataclass(slots=True)
 class DeliveryItem:
     """納品書の明細行"""
     slip_number: str  # 伝票番号
@@ -17,7 +17,7 @@ class DeliveryItem:
     date: str = ""  # 日付（月次請求書で個別の納品日を表示するため）
 
 
-@dataclass
+@dataclass(slots=True)
 class DeliveryNote:
     """納品書データ"""
     date: str  # 日付（YYYY/MM/DD）
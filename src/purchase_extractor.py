@@ -1,11 +1,12 @@
 """仕入れ納品書データの構造定義と抽出処理"""
 from dataclasses import dataclass, field
-from typing import Optional
+from pathlib import Path
+from typing import Optional, Protocol, Sequence
 
 from .llm_extractor import LLMExtractor
 
 
-@dataclass
+@dataclass(slots=True)
 class PurchaseItem:
     """仕入れ納品書の明細行"""
     product_code: str  # 商品コード
@@ -15,7 +16,7 @@ class PurchaseItem:
     amount: int  # 金額
 
 
-@dataclass
+@dataclass(slots=True)  # canonical 化・課税区分補正で書き換えるので frozen にはしない
 class PurchaseInvoice:
     """仕入れ納品書データ"""
     date: str  # 日付（YYYY/MM/DD）
@@ -38,6 +39,43 @@ class PurchaseInvoice:
             self.total = self.subtotal + self.tax
 
 
+def _parse_is_taxable(value) -> bool:
+    """LLM 出力の is_taxable を真偽値に変換（"false" / "0" 等の文字列も解釈、不明なら課税）"""
+    if isinstance(value, bool):
+        return value
+    if value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        normalized = value.strip().lower()
+        if normalized in ("false", "0"):
+            return False
+        if normalized in ("true", "1"):
+            return True
+    return True
+
+
+class PurchaseItemLike(Protocol):
+    """DB保存で参照する明細の属性（PurchaseItem / APIリクエストモデルの双方が満たす）"""
+    product_code: str
+    product_name: str
+    quantity: int
+    unit_price: int
+    amount: int
+
+
+class PurchaseInvoiceLike(Protocol):
+    """DB保存で参照する納品書の属性（PurchaseInvoice / APIリクエストモデルの双方が満たす）"""
+    date: str
+    slip_number: str
+    subtotal: int
+    tax: int
+    total: int
+    is_taxable: bool
+
+    @property
+    def items(self) -> Sequence[PurchaseItemLike]: ...
+
+
 # Gemini用の仕入れ抽出プロンプト（配列で返す）
 PURCHASE_EXTRACTION_PROMPT = """
 この画像は仕入れ納品書（または請求書）です。**1つのPDFに複数の納品書が含まれる場合があります。**
@@ -158,8 +196,6 @@ class PurchaseExtractor(LLMExtractor):
         Returns:
             list[PurchaseInvoice]: 抽出されたデータのリスト、失敗時は空リスト
         """
-        from pathlib import Path
-
         try:
             # PDFを画像に変換
             images = self._pdf_to_images(Path(pdf_path))
@@ -232,15 +268,16 @@ class PurchaseExtractor(LLMExtractor):
                     seen.add(s)
                     indicators.append(s)
 
+            # LLM は null や数値を返すことがあるので文字列項目は str に揃える
             invoice = PurchaseInvoice(
-                date=entry.get("date", ""),
-                supplier_name=entry.get("supplier_name", ""),
-                slip_number=entry.get("slip_number", ""),
+                date=str(entry.get("date") or ""),
+                supplier_name=str(entry.get("supplier_name") or ""),
+                slip_number=str(entry.get("slip_number") or ""),
                 items=items,
                 subtotal=subtotal,
                 tax=tax,
                 total=total,
-                is_taxable=entry.get("is_taxable", True),
+                is_taxable=_parse_is_taxable(entry.get("is_taxable", True)),
                 detected_indicators=indicators,
             )
 
@@ -254,28 +291,16 @@ class PurchaseExtractor(LLMExtractor):
     def _extract_purchase_with_gemini(self, images) -> Optional[list]:
         """Geminiに画像を直接送信して仕入れ納品書の構造化データを抽出（配列で返す）"""
         import json
-        from io import BytesIO
-        from google.genai import types
 
         try:
-            # 画像パーツを作成
-            contents = []
-            for image in images:
-                buffer = BytesIO()
-                image.save(buffer, format="PNG")
-                image_part = types.Part.from_bytes(
-                    data=buffer.getvalue(),
-                    mime_type="image/png",
-                )
-                contents.append(image_part)
-
-            # プロンプトを追加
-            contents.append(PURCHASE_EXTRACTION_PROMPT)
-
-            # Gemini APIに送信
+            # 画像パーツを作成（ページごとの JPEG エンコードを並列化）
+            contents = self._image_parts(images)
+
+            # Gemini APIに送信（プロンプトはキャッシュ済みのシステム指示として渡す）
             response = self.gemini_client.models.generate_content(
                 model=self.model,
                 contents=contents,
+                config=self._prompt_config(PURCHASE_EXTRACTION_PROMPT),
             )
             response_text = response.text
 
@@ -6,12 +6,15 @@ monthly_*)を真値とする会社解決関数のみを提供する。
 """
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional
 import re
+import unicodedata
 
-from .canonical_companies import list_canonicals
+from .canonical_companies import CACHE_MISS, company_master_cache, list_canonicals
 
 
+@lru_cache(maxsize=4096)
 def normalize_company_name(name: str) -> str:
     """会社名を正規化（法人格・敬称・読み仮名を除去）
 
@@ -19,12 +22,13 @@ def normalize_company_name(name: str) -> str:
     - "株式会社SIM" → "SIM"
     - "（株）SIM 御中" → "SIM"
     - "株式会社SIM（シム）" → "SIM"
+
+    DB検索・canonical 照合で同じ会社名を何度も正規化するため結果をキャッシュする。
     """
     if not name:
         return ""
 
     # NFKC正規化（濁点の合成形/分解形の差異、半角/全角カタカナの差異を吸収）
-    import unicodedata
     name = unicodedata.normalize('NFKC', name)
 
     # 法人格を除去（㈱ = U+3231, ㈲ = U+3232 も対応）
@@ -106,12 +110,13 @@ def match_company_name_with_filename(
         return None  # 正規化後に同名の異なる会社 → 曖昧
 
     # 子 (sibling) 候補: normalized_search の prefix で始まる、より長い canonical
-    siblings: list[str] = []
-    for n, cs in canon_by_norm.items():
-        if n != normalized_search and n.startswith(normalized_search):
-            for c in cs:
-                if c not in siblings:
-                    siblings.append(c)
+    # 重複除去は dict で行う（候補が多いとリストの in 判定が二乗になる）
+    siblings = list(dict.fromkeys(
+        c
+        for n, cs in canon_by_norm.items()
+        if n != normalized_search and n.startswith(normalized_search)
+        for c in cs
+    ))
 
     # 親なし・子なし → 既存の partial-match ロジックにフォールバック
     if not exact and not siblings:
@@ -331,17 +336,28 @@ def get_canonical_company_name(
     return canonical
 
 
+_purchase_canonical_cache = company_master_cache()
+
+
 def get_canonical_purchase_company_name(
     company_name: str,
     year: Optional[int] = None,
     filename: Optional[str] = None,
 ) -> Optional[str]:
-    """仕入 canonical 会社名を取得（company_master/canonical 経由・シート非依存）"""
+    """仕入 canonical 会社名を取得（company_master/canonical 経由・シート非依存）
+
+    結果は (company_name, filename) ごとに TTL キャッシュする（year は未使用なのでキーに含めない）。
+    """
+    key = (company_name, filename)
+    cached = _purchase_canonical_cache.get(key)
+    if cached is not CACHE_MISS:
+        return cached
     canonical = match_company_name_with_filename(
         company_name, list_canonicals("purchase"), filename=filename
     )
     if canonical:
         print(f"    仕入れ正規会社名取得: '{company_name}' → '{canonical}' (filename={filename!r})")
+    _purchase_canonical_cache.set(key, canonical)
     return canonical
 
 
@@ -350,8 +366,8 @@ def get_company_info(company_name: str) -> Optional[CompanyInfo]:
 
     法人格(株式会社/(株)等)と敬称(御中/様)を除去してマッチング。
     """
-    from .database import MonthlyItemsDB
-    db = MonthlyItemsDB()
+    from .database import get_shared_db
+    db = get_shared_db()
     companies = db.list_companies("sales", include_inactive=True)
     master_names = [c["canonical_name"] for c in companies]
     matched = match_company_name(company_name, master_names)
@@ -389,8 +405,8 @@ def get_previous_billing(
 
         current_ym_jp = f"{year}年{month}月"
 
-        from .database import MonthlyItemsDB
-        db = MonthlyItemsDB()
+        from .database import get_shared_db
+        db = get_shared_db()
         ledger = db.compute_ledger(company_name, current_ym_jp)
 
         previous_amount = ledger["previous_balance"]